@@ -1,16 +1,18 @@
 import base64
-from collections import deque
 from datetime import datetime
-from functools import wraps
+from functools import lru_cache, wraps
 import hashlib
 import hmac
+from itertools import islice
 import logging
 import os
-import random
-import string
+import re
+import secrets
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import quote
 from uuid import uuid4
+from werkzeug.datastructures import LanguageAccept
+from werkzeug.http import parse_accept_header
 from werkzeug.utils import secure_filename
 
 from bson import ObjectId
@@ -21,6 +23,7 @@ from flask import (
     flash,
     g,
     jsonify,
+    make_response,
     redirect,
     render_template,
     request,
@@ -28,6 +31,8 @@ from flask import (
     url_for,
 )
 from flask_wtf.csrf import CSRFProtect
+from jinja2 import FileSystemBytecodeCache
+from jinja2.utils import htmlsafe_json_dumps
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_caching import Cache
@@ -35,6 +40,26 @@ from marshmallow import ValidationError as MarshmallowValidationError
 from pymongo import MongoClient, ASCENDING, DESCENDING
 from pymongo.errors import DuplicateKeyError, PyMongoError
 from cryptography.fernet import Fernet, InvalidToken
+from PIL import Image, ImageOps
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:
+    PasswordHasher = None
+
+try:
+    from flask_session import Session as ServerSideSession
+    import redis
+except ImportError:
+    ServerSideSession = None
+
+try:
+    # Rust tabanlı, API uyumlu Fernet; kuruluysa TCKN şifrelemesinde tercih edilir.
+    from rfernet import DecryptionError as RustInvalidToken, Fernet as RustFernet
+except ImportError:
+    RustFernet = None
+    RustInvalidToken = InvalidToken
 
 from bestsoft import init_bestsoft, create_default_admin
 from config import get_config
@@ -53,13 +78,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-_identity_cipher: Optional[Fernet] = None
-_SYS_RANDOM = random.SystemRandom()
-_PASSWORD_HASH_CHARS = string.ascii_letters + string.digits
+_mongo_client: Optional[MongoClient] = None
 _PASSWORD_HASH_METHOD = "pbkdf2"
 _PASSWORD_HASH_NAME = "sha256"
 _PASSWORD_DEFAULT_ITERATIONS = 260000
 _PASSWORD_SALT_LENGTH = 16
+_ARGON2_PREFIX = "$argon2"
+# Argon2id, OWASP alt sınırı: 19 MiB bellek, t=2, p=1
+_ARGON2_HASHER = (
+    PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1)
+    if PasswordHasher is not None
+    else None
+)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BESTSOFT_DIST_DIR = os.path.join(BASE_DIR, "templates", "bestsoft", "BestLTE", "dist")
@@ -75,6 +105,14 @@ LANGUAGE_LABELS = {
 }
 
 ALLOWED_AVATAR_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+_ALLOWED_AVATAR_SUFFIXES = tuple(f".{ext}" for ext in ALLOWED_AVATAR_EXTENSIONS)
+AVATAR_MAX_DIMENSIONS = (512, 512)
+# Bu boyutun altındaki, boyut sınırına uyan ve EXIF taşımayan avatarlar yeniden kodlanmadan kaydedilir
+AVATAR_PASSTHROUGH_BYTES = 10 * 1024
+# Olduğu gibi kaydedilen dosyanın uzantısı istemcinin dosya adından değil, algılanan biçimden gelir
+_AVATAR_FORMAT_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "WEBP": "webp"}
+# Başlıktaki boyut bu sınırı aşarsa görsel çözülmeden reddedilir (sıkıştırma bombası koruması)
+AVATAR_MAX_PIXELS = 40_000_000
 DEMO_LOGIN_IDENTIFIER = "000954"
 DEMO_LOGIN_PASSWORD = "12345"
 _TRANSLATIONS: Dict[str, Dict[str, str]] = {
@@ -228,6 +266,114 @@ DEFAULT_SECURITY_BAND = [
 ]
 
 
+COUNTRY_OPTIONS: Tuple[Dict[str, str], ...] = (
+    {"dial_code": "90", "name": "Türkiye"},
+)
+
+PROVINCES: Dict[str, Tuple[str, ...]] = {
+    "Adana": ("Aladağ", "Ceyhan", "Çukurova", "Feke", "İmamoğlu", "Karaisalı", "Karataş", "Kozan", "Pozantı", "Saimbeyli", "Sarıçam", "Seyhan", "Tufanbeyli", "Yumurtalık", "Yüreğir"),
+    "Adıyaman": ("Besni", "Çelikhan", "Gerger", "Gölbaşı", "Kahta", "Merkez", "Samsat", "Sincik", "Tut"),
+    "Afyonkarahisar": ("Başmakçı", "Bayat", "Bolvadin", "Çay", "Çobanlar", "Dazkırı", "Dinar", "Emirdağ", "Evciler", "Hocalar", "İhsaniye", "İscehisar", "Kızılören", "Merkez", "Sandıklı", "Sinanpaşa", "Sultandağı", "Şuhut"),
+    "Ağrı": ("Diyadin", "Doğubayazıt", "Eleşkirt", "Hamur", "Merkez", "Patnos", "Taşlıçay", "Tutak"),
+    "Aksaray": ("Ağaçören", "Aksaray", "Eskil", "Gülağaç", "Güzelyurt", "Ortaköy", "Sarıyahşi"),
+    "Amasya": ("Göynücek", "Gümüşhacıköy", "Hamamözü", "Merkez", "Merzifon", "Suluova", "Taşova"),
+    "Ankara": ("Akyurt", "Altındağ", "Ayaş", "Balâ", "Beypazarı", "Çamlıdere", "Çankaya", "Çubuk", "Elmadağ", "Etimesgut", "Evren", "Gölbaşı", "Güdül", "Haymana", "Kahramankazan", "Kalecik", "Keçiören", "Kızılcahamam", "Mamak", "Nallıhan", "Polatlı", "Pursaklar", "Sincan", "Şereflikoçhisar", "Yenimahalle"),
+    "Antalya": ("Akseki", "Aksu", "Alanya", "Demre", "Döşemealtı", "Elmalı", "Finike", "Gazipaşa", "Gündoğmuş", "İbradı", "Kaş", "Kemer", "Kepez", "Konyaaltı", "Korkuteli", "Kumluca", "Manavgat", "Muratpaşa", "Serik"),
+    "Artvin": ("Ardanuç", "Arhavi", "Borçka", "Hopa", "Kemalpaşa", "Merkez", "Murgul", "Şavşat", "Yusufeli"),
+    "Ardahan": ("Çıldır", "Damal", "Göle", "Hanak", "Merkez", "Posof"),
+    "Aydın": ("Bozdoğan", "Buharkent", "Çine", "Didim", "Efeler", "Germencik", "İncirliova", "Karacasu", "Karpuzlu", "Koçarlı", "Köşk", "Kuşadası", "Kuyucak", "Nazilli", "Söke", "Sultanhisar", "Yenipazar"),
+    "Balıkesir": ("Altıeylül", "Ayvalık", "Balya", "Bandırma", "Bigadiç", "Burhaniye", "Dursunbey", "Edremit", "Erdek", "Gömeç", "Gönen", "Havran", "İvrindi", "Karesi", "Kepsut", "Manyas", "Marmara", "Savaştepe", "Sındırgı", "Susurluk"),
+    "Bartın": ("Amasra", "Kurucaşile", "Merkez", "Ulus"),
+    "Batman": ("Beşiri", "Gercüş", "Hasankeyf", "Kozluk", "Merkez", "Sason"),
+    "Bayburt": ("Aydıntepe", "Demirözü", "Merkez"),
+    "Bilecik": ("Bozüyük", "Gölpazarı", "İnhisar", "Merkez", "Osmaneli", "Pazaryeri", "Söğüt", "Yenipazar"),
+    "Bingöl": ("Adaklı", "Genç", "Karlıova", "Kığı", "Merkez", "Solhan", "Yayladere", "Yedisu"),
+    "Bitlis": ("Adilcevaz", "Ahlat", "Güroymak", "Hizan", "Merkez", "Mutki", "Tatvan"),
+    "Bolu": ("Dörtdivan", "Gerede", "Göynük", "Kıbrıscık", "Mengen", "Merkez", "Mudurnu", "Seben", "Yeniçağa"),
+    "Burdur": ("Ağlasun", "Altınyayla", "Bucak", "Çavdır", "Çeltikçi", "Gölhisar", "Karamanlı", "Kemer", "Merkez", "Tefenni", "Yeşilova"),
+    "Bursa": ("Büyükorhan", "Gemlik", "Gürsu", "Harmancık", "İnegöl", "İznik", "Karacabey", "Keles", "Kestel", "Mudanya", "Mustafakemalpaşa", "Nilüfer", "Orhaneli", "Orhangazi", "Osmangazi", "Yenişehir", "Yıldırım"),
+    "Çanakkale": ("Ayvacık", "Bayramiç", "Biga", "Bozcaada", "Çan", "Eceabat", "Ezine", "Gelibolu", "Gökçeada", "Lapseki", "Merkez", "Yenice"),
+    "Çankırı": ("Atkaracalar", "Bayramören", "Çerkeş", "Eldivan", "Ilgaz", "Kızılırmak", "Korgun", "Kurşunlu", "Merkez", "Orta", "Şabanözü", "Yapraklı"),
+    "Çorum": ("Alaca", "Bayat", "Boğazkale", "Dodurga", "İskilip", "Kargı", "Laçin", "Mecitözü", "Merkez", "Oğuzlar", "Osmancık", "Sungurlu", "Uğurludağ"),
+    "Denizli": ("Acıpayam", "Babadağ", "Baklan", "Bekilli", "Beyağaç", "Bozkurt", "Buldan", "Çal", "Çameli", "Çardak", "Çivril", "Güney", "Honaz", "Kale", "Merkezefendi", "Pamukkale", "Sarayköy", "Serinhisar", "Tavas"),
+    "Diyarbakır": ("Bağlar", "Bismil", "Çermik", "Çınar", "Çüngüş", "Dicle", "Eğil", "Ergani", "Hani", "Hazro", "Kayapınar", "Kocaköy", "Kulp", "Lice", "Silvan", "Sur", "Yenişehir"),
+    "Düzce": ("Akçakoca", "Cumayeri", "Çilimli", "Gölyaka", "Gümüşova", "Kaynaşlı", "Merkez", "Yığılca"),
+    "Edirne": ("Enez", "Havsa", "İpsala", "Keşan", "Lalapaşa", "Meriç", "Merkez", "Süloğlu", "Uzunköprü"),
+    "Elazığ": ("Ağın", "Alacakaya", "Arıcak", "Baskil", "Karakoçan", "Keban", "Kovancılar", "Maden", "Merkez", "Palu", "Sivrice"),
+    "Erzincan": ("Çayırlı", "İliç", "Kemah", "Kemaliye", "Merkez", "Otlukbeli", "Refahiye", "Tercan", "Üzümlü"),
+    "Erzurum": ("Aşkale", "Aziziye", "Çat", "Hınıs", "Horasan", "İspir", "Karaçoban", "Karayazı", "Köprüköy", "Narman", "Oltu", "Olur", "Palandöken", "Pasinler", "Pazaryolu", "Şenkaya", "Tekman", "Tortum", "Uzundere", "Yakutiye"),
+    "Eskişehir": ("Alpu", "Beylikova", "Çifteler", "Günyüzü", "Han", "İnönü", "Mahmudiye", "Mihalgazi", "Mihalıççık", "Odunpazarı", "Sarıcakaya", "Seyitgazi", "Sivrihisar", "Tepebaşı"),
+    "Gaziantep": ("Araban", "İslahiye", "Karkamış", "Nizip", "Nurdağı", "Oğuzeli", "Şahinbey", "Şehitkamil", "Yavuzeli"),
+    "Giresun": ("Alucra", "Bulancak", "Çamoluk", "Çanakçı", "Dereli", "Doğankent", "Espiye", "Eynesil", "Görele", "Güce", "Keşap", "Merkez", "Piraziz", "Şebinkarahisar", "Tirebolu", "Yağlıdere"),
+    "Gümüşhane": ("Kelkit", "Köse", "Kürtün", "Merkez", "Şiran", "Torul"),
+    "Hakkari": ("Çukurca", "Derecik", "Merkez", "Şemdinli", "Yüksekova"),
+    "Hatay": ("Altınözü", "Antakya", "Arsuz", "Belen", "Defne", "Dörtyol", "Erzin", "Hassa", "İskenderun", "Kırıkhan", "Kumlu", "Payas", "Reyhanlı", "Samandağ", "Yayladağı"),
+    "Iğdır": ("Aralık", "Karakoyunlu", "Merkez", "Tuzluca"),
+    "Isparta": ("Aksu", "Atabey", "Eğirdir", "Gelendost", "Gönen", "Keçiborlu", "Merkez", "Senirkent", "Sütçüler", "Şarkikaraağaç", "Uluborlu", "Yalvaç", "Yenişarbademli"),
+    "İstanbul": ("Adalar", "Arnavutköy", "Ataşehir", "Avcılar", "Bağcılar", "Bahçelievler", "Bakırköy", "Başakşehir", "Bayrampaşa", "Beşiktaş", "Beykoz", "Beylikdüzü", "Beyoğlu", "Büyükçekmece", "Çatalca", "Çekmeköy", "Esenler", "Esenyurt", "Eyüpsultan", "Fatih", "Gaziosmanpaşa", "Güngören", "Kadıköy", "Kağıthane", "Kartal", "Küçükçekmece", "Maltepe", "Pendik", "Sancaktepe", "Sarıyer", "Silivri", "Sultanbeyli", "Sultangazi", "Şile", "Şişli", "Tuzla", "Ümraniye", "Üsküdar", "Zeytinburnu"),
+    "İzmir": ("Aliağa", "Balçova", "Bayındır", "Bayraklı", "Bergama", "Beydağ", "Bornova", "Buca", "Çeşme", "Çiğli", "Dikili", "Foça", "Gaziemir", "Güzelbahçe", "Karabağlar", "Karaburun", "Karşıyaka", "Kemalpaşa", "Kınık", "Kiraz", "Konak", "Menderes", "Menemen", "Narlıdere", "Ödemiş", "Seferihisar", "Selçuk", "Tire", "Torbalı", "Urla"),
+    "Kahramanmaraş": ("Afşin", "Andırın", "Çağlayancerit", "Dulkadiroğlu", "Ekinözü", "Elbistan", "Göksun", "Nurhak", "Onikişubat", "Pazarcık", "Türkoğlu"),
+    "Karabük": ("Eflani", "Eskipazar", "Karabük", "Ovacık", "Safranbolu", "Yenice"),
+    "Karaman": ("Ayrancı", "Başyayla", "Ermenek", "Karaman", "Kazımkarabekir", "Sarıveliler"),
+    "Kars": ("Akyaka", "Arpaçay", "Digor", "Kağızman", "Merkez", "Sarıkamış", "Selim", "Susuz"),
+    "Kastamonu": ("Abana", "Ağlı", "Araç", "Azdavay", "Bozkurt", "Cide", "Çatalzeytin", "Daday", "Devrekani", "Doğanyurt", "Hanönü", "İhsangazi", "İnebolu", "Küre", "Merkez", "Pınarbaşı", "Seydiler", "Şenpazar", "Taşköprü", "Tosya"),
+    "Kayseri": ("Akkışla", "Bünyan", "Develi", "Felahiye", "Hacılar", "İncesu", "Kocasinan", "Melikgazi", "Özvatan", "Pınarbaşı", "Sarıoğlan", "Sarız", "Talas", "Tomarza", "Yahyalı", "Yeşilhisar"),
+    "Kırıkkale": ("Bahşılı", "Balışeyh", "Çelebi", "Delice", "Karakeçili", "Keskin", "Merkez", "Sulakyurt", "Yahşihan"),
+    "Kırklareli": ("Babaeski", "Demirköy", "Kofçaz", "Lüleburgaz", "Merkez", "Pehlivanköy", "Pınarhisar", "Vize"),
+    "Kırşehir": ("Akçakent", "Akpınar", "Boztepe", "Çiçekdağı", "Kaman", "Merkez", "Mucur"),
+    "Kilis": ("Elbeyli", "Merkez", "Musabeyli", "Polateli"),
+    "Kocaeli": ("Başiskele", "Çayırova", "Darıca", "Derince", "Dilovası", "Gebze", "Gölcük", "İzmit", "Kandıra", "Karamürsel", "Kartepe", "Körfez"),
+    "Konya": ("Ahırlı", "Akören", "Akşehir", "Altınekin", "Beyşehir", "Bozkır", "Cihanbeyli", "Çeltik", "Çumra", "Derbent", "Derebucak", "Doğanhisar", "Emirgazi", "Ereğli", "Güneysınır", "Hadım", "Halkapınar", "Hüyük", "Ilgın", "Kadınhanı", "Karapınar", "Karatay", "Kulu", "Meram", "Sarayönü", "Selçuklu", "Seydişehir", "Taşkent", "Tuzlukçu", "Yalıhüyük", "Yunak"),
+    "Kütahya": ("Altıntaş", "Aslanapa", "Çavdarhisar", "Domaniç", "Dumlupınar", "Emet", "Gediz", "Hisarcık", "Merkez", "Pazarlar", "Simav", "Şaphane", "Tavşanlı"),
+    "Malatya": ("Akçadağ", "Arapgir", "Arguvan", "Battalgazi", "Darende", "Doğanşehir", "Doğanyol", "Hekimhan", "Kale", "Kuluncak", "Pütürge", "Yazıhan", "Yeşilyurt"),
+    "Manisa": ("Ahmetli", "Akhisar", "Alaşehir", "Demirci", "Gölmarmara", "Gördes", "Kırkağaç", "Köprübaşı", "Kula", "Salihli", "Sarıgöl", "Saruhanlı", "Selendi", "Soma", "Şehzadeler", "Turgutlu", "Yunusemre"),
+    "Mardin": ("Artuklu", "Dargeçit", "Derik", "Kızıltepe", "Mazıdağı", "Midyat", "Nusaybin", "Ömerli", "Savur", "Yeşilli"),
+    "Mersin": ("Akdeniz", "Anamur", "Aydıncık", "Bozyazı", "Çamlıyayla", "Erdemli", "Gülnar", "Mezitli", "Mut", "Silifke", "Tarsus", "Toroslar", "Yenişehir"),
+    "Muğla": (
+        "Bodrum", "Dalaman", "Datça", "Fethiye", "Kavaklıdere", "Köyceğiz", "Marmaris", "Menteşe", "Milas", "Ortaca", "Seydikemer", "Ula", "Yatağan"
+    ),
+    "Muş": ("Bulanık", "Hasköy", "Korkut", "Malazgirt", "Merkez", "Varto"),
+    "Nevşehir": ("Acıgöl", "Avanos", "Derinkuyu", "Gülşehir", "Hacıbektaş", "Kozaklı", "Merkez", "Ürgüp"),
+    "Niğde": ("Altunhisar", "Bor", "Çamardı", "Çiftlik", "Merkez", "Ulukışla"),
+    "Ordu": ("Akkuş", "Altınordu", "Aybastı", "Çamaş", "Çatalpınar", "Çaybaşı", "Fatsa", "Gölköy", "Gülyalı", "Gürgentepe", "İkizce", "Kabadüz", "Kabataş", "Korgan", "Kumru", "Mesudiye", "Perşembe", "Ulubey", "Ünye"),
+    "Osmaniye": ("Bahçe", "Düziçi", "Kadirli", "Merkez", "Sumbas", "Toprakkale"),
+    "Rize": ("Ardeşen", "Çamlıhemşin", "Çayeli", "Derepazarı", "Fındıklı", "Güneysu", "Hemşin", "İkizdere", "İyidere", "Kalkandere", "Merkez", "Pazar"),
+    "Sakarya": ("Adapazarı", "Akyazı", "Arifiye", "Erenler", "Ferizli", "Geyve", "Hendek", "Karapürçek", "Karasu", "Kaynarca", "Kocaali", "Pamukova", "Sapanca", "Serdivan", "Söğütlü", "Taraklı"),
+    "Samsun": ("Alaçam", "Asarcık", "Atakum", "Ayvacık", "Bafra", "Canik", "Çarşamba", "Havza", "İlkadım", "Kavak", "Ladik", "Ondokuzmayıs", "Salıpazarı", "Tekkeköy", "Terme", "Vezirköprü", "Yakakent"),
+    "Siirt": ("Baykan", "Eruh", "Kurtalan", "Merkez", "Pervari", "Şirvan", "Tillo"),
+    "Sinop": ("Ayancık", "Boyabat", "Dikmen", "Durağan", "Erfelek", "Gerze", "Merkez", "Saraydüzü", "Türkeli"),
+    "Sivas": ("Akıncılar", "Altınyayla", "Divriği", "Doğanşar", "Gemerek", "Gölova", "Gürün", "Hafik", "İmranlı", "Kangal", "Koyulhisar", "Merkez", "Suşehri", "Şarkışla", "Ulaş", "Yıldızeli", "Zara"),
+    "Şanlıurfa": ("Akçakale", "Birecik", "Bozova", "Ceylanpınar", "Eyyübiye", "Halfeti", "Haliliye", "Harran", "Hilvan", "Karaköprü", "Siverek", "Suruç", "Viranşehir"),
+    "Şırnak": ("Beytüşşebap", "Cizre", "Güçlükonak", "İdil", "Merkez", "Silopi", "Uludere"),
+    "Tekirdağ": ("Çerkezköy", "Çorlu", "Ergene", "Hayrabolu", "Kapaklı", "Malkara", "Marmaraereğlisi", "Muratlı", "Saray", "Süleymanpaşa", "Şarköy"),
+    "Tokat": ("Almus", "Artova", "Başçiftlik", "Erbaa", "Merkez", "Niksar", "Pazar", "Reşadiye", "Sulusaray", "Turhal", "Yeşilyurt", "Zile"),
+    "Trabzon": ("Akçaabat", "Araklı", "Arsin", "Beşikdüzü", "Çarşıbaşı", "Çaykara", "Dernekpazarı", "Düzköy", "Hayrat", "Köprübaşı", "Maçka", "Of", "Ortahisar", "Sürmene", "Şalpazarı", "Tonya", "Vakfıkebir", "Yomra"),
+    "Tunceli": ("Çemişgezek", "Hozat", "Mazgirt", "Merkez", "Nazımiye", "Ovacık", "Pertek", "Pülümür"),
+    "Uşak": ("Banaz", "Eşme", "Karahallı", "Merkez", "Sivaslı", "Ulubey"),
+    "Van": ("Bahçesaray", "Başkale", "Çaldıran", "Çatak", "Edremit", "Erciş", "Gevaş", "Gürpınar", "İpekyolu", "Muradiye", "Özalp", "Saray", "Tuşba"),
+    "Yalova": ("Altınova", "Armutlu", "Çınarcık", "Çiftlikköy", "Merkez", "Termal"),
+    "Yozgat": ("Akdağmadeni", "Aydıncık", "Boğazlıyan", "Çandır", "Çayıralan", "Çekerek", "Kadışehri", "Merkez", "Saraykent", "Sarıkaya", "Şefaatli", "Sorgun", "Yenifakılı", "Yerköy"),
+    "Zonguldak": ("Alaplı", "Çaycuma", "Devrek", "Ereğli", "Gökçebey", "Kilimli", "Kozlu", "Merkez"),
+}
+
+# Kayıt formu doğrulaması için türetilmiş, sabit zamanlı arama tabloları
+COUNTRY_BY_DIAL: Dict[str, Dict[str, str]] = {c["dial_code"]: c for c in COUNTRY_OPTIONS}
+PROVINCE_LIST: Tuple[str, ...] = tuple(PROVINCES)
+PROVINCE_DISTRICT_SET: Dict[str, frozenset] = {
+    city: frozenset(districts) for city, districts in PROVINCES.items()
+}
+# Kayıt sayfasındaki il/ilçe seçimi için JSON bir kez üretilir (|tojson ile aynı HTML kaçışı)
+PROVINCES_JSON = htmlsafe_json_dumps(PROVINCES, ensure_ascii=False, separators=(",", ":"))
+
+
+@lru_cache(maxsize=512)
+def _best_locale(accept_language: str) -> Optional[str]:
+    """Accept-Language başlığına göre en uygun dili seç (başlık değerine göre önbellekli)."""
+    if not accept_language:
+        return None
+    return parse_accept_header(accept_language, LanguageAccept).best_match(SUPPORTED_LOCALES)
+
+
 def _fetch_site_setting(app: Flask, key: str, locale: Optional[str]) -> Optional[Dict[str, Any]]:
     locale_key = locale or "default"
     doc = app.db.site_settings.find_one({"key": key, "locale": locale_key})
@@ -324,23 +470,46 @@ def set_site_text_value(app: Flask, key: str, locale: str, value: str, metadata:
         raise
 
 
+_INITIALS_AVATAR_SVG = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}">'
+    '<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
+    '<stop offset="0%" stop-color="#7C3AED"/><stop offset="100%" stop-color="#A855F7"/>'
+    '</linearGradient></defs>'
+    '<rect width="{size}" height="{size}" rx="{half}" fill="url(#g)"/>'
+    '<text x="50%" y="55%" dominant-baseline="middle" text-anchor="middle" '
+    'font-family="Roboto,Helvetica,Arial,sans-serif" font-size="{font_size}" font-weight="700" fill="#fff">'
+    '{initials}'
+    '</text></svg>'
+)
+# "#", "%" ve '"' kodlanmaya devam eder: "#" data URL içinde fragment başlatır.
+_INITIALS_AVATAR_SAFE_CHARS = "/<>=:,; "
+
+
 def build_initials_avatar(initials: str, size: int = 256) -> str:
     """
     Create a data URL with SVG showing the initials on a gradient circle.
     """
-    initials_text = (initials or "?")[:2]
-    svg = (
-        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}">'
-        f'<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
-        f'<stop offset="0%" stop-color="#7C3AED"/><stop offset="100%" stop-color="#A855F7"/>'
-        f'</linearGradient></defs>'
-        f'<rect width="{size}" height="{size}" rx="{size//2}" fill="url(#g)"/>'
-        f'<text x="50%" y="55%" dominant-baseline="middle" text-anchor="middle" '
-        f'font-family="Roboto,Helvetica,Arial,sans-serif" font-size="{int(size*0.38)}" font-weight="700" fill="#fff">'
-        f'{initials_text}'
-        f'</text></svg>'
+    svg = _INITIALS_AVATAR_SVG.format_map(
+        {
+            "size": size,
+            "half": size // 2,
+            "font_size": int(size * 0.38),
+            "initials": (initials or "?")[:2],
+        }
     )
-    return f"data:image/svg+xml;utf8,{quote(svg)}"
+    return f"data:image/svg+xml;utf8,{quote(svg, safe=_INITIALS_AVATAR_SAFE_CHARS)}"
+
+
+_INITIAL_RE = re.compile(r"(?<!\S)\S")
+# Telefon / TCKN temizliği için derlenmiş desenler
+_NON_PHONE_RE = re.compile(r"[^\d+]")
+_NON_DIGIT_RE = re.compile(r"\D")
+# Sponsor aramalarında yalnızca form ve yerleşim için gereken alanlar
+SPONSOR_PROJECTION = {"_id": 1, "name": 1, "referral_code": 1}
+# referral_code unique index çakışmasında en fazla bu kadar yeni kod denenir
+REFERRAL_CODE_ATTEMPTS = 5
+# ?sponsor= değeri bu uzunlukta kesilir (üretilen kodlar "TR" + en fazla 9 hane)
+SPONSOR_CODE_MAX_LENGTH = 32
 
 
 def generate_initials(name: str, max_letters: int = 2) -> str:
@@ -349,14 +518,34 @@ def generate_initials(name: str, max_letters: int = 2) -> str:
     """
     if not name:
         return ""
-    initials: List[str] = []
-    for part in name.strip().split():
-        if not part:
-            continue
-        initials.append(part[0].upper())
-        if len(initials) >= max_letters:
-            break
-    return "".join(initials)
+    matches = islice(_INITIAL_RE.finditer(name), max_letters)
+    return "".join(match.group().upper() for match in matches)
+
+
+@lru_cache(maxsize=4096)
+def initials_avatar_for(name: str) -> str:
+    """
+    Return the initials avatar data URL for `name`, memoized since it is pure.
+    """
+    return build_initials_avatar(generate_initials(name))
+
+
+ORDERS_PER_PAGE = 20
+# Sipariş listesinde gösterilen alanlar (teslimat adresi vb. okunmaz)
+ORDER_LIST_PROJECTION = {
+    "order_number": 1,
+    "status": 1,
+    "total": 1,
+    "created_at": 1,
+    "items.name": 1,
+    "items.price": 1,
+    "items.quantity": 1,
+}
+# Sepet, ödeme ve sipariş kaydında kullanılan ürün alanları
+CART_PRODUCT_PROJECTION = {"name": 1, "price": 1, "image_url": 1, "category": 1}
+PRODUCT_CACHE_TIMEOUT = 60  # seconds
+# Ana sayfadaki ürün kartlarının kullandığı alanlar
+PRODUCT_CARD_PROJECTION = {"name": 1, "price": 1, "image_url": 1, "category": 1, "description": 1}
 
 
 def collect_varis_members(user: Dict[str, Any]) -> List[Dict[str, str]]:
@@ -402,13 +591,12 @@ def collect_varis_members(user: Dict[str, Any]) -> List[Dict[str, str]]:
         )
 
     manual_varis = profile.get("varis_entries", [])
+    pending_entry_ids: Dict[str, str] = {}
     for idx, manual in enumerate(manual_varis):
-        entry_id = manual.get("entry_id") or f"manual-{uuid4().hex}"
-        if not manual.get("entry_id"):
-            app.db.users.update_one(
-                {"_id": user["_id"]},
-                {"$set": {f"profile.varis_entries.{idx}.entry_id": entry_id}},
-            )
+        entry_id = manual.get("entry_id")
+        if not entry_id:
+            entry_id = f"manual-{uuid4().hex}"
+            pending_entry_ids[f"profile.varis_entries.{idx}.entry_id"] = entry_id
         varis_members.append(
             {
                 "entry_id": entry_id,
@@ -423,6 +611,10 @@ def collect_varis_members(user: Dict[str, Any]) -> List[Dict[str, str]]:
             }
         )
 
+    if pending_entry_ids:
+        # Eski kayıtlardaki eksik entry_id'leri tek bir $set ile tamamla.
+        app.db.users.update_one({"_id": user["_id"]}, {"$set": pending_entry_ids})
+
     return varis_members
 
 
@@ -430,12 +622,56 @@ def allowed_avatar_file(filename: str) -> bool:
     """
     Check whether a filename has an approved image extension.
     """
-    if not filename:
-        return False
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_AVATAR_EXTENSIONS
+    return bool(filename) and filename.lower().endswith(_ALLOWED_AVATAR_SUFFIXES)
+
+
+def save_avatar_image(file_storage, directory: str, basename: str, size: int) -> str:
+    """
+    Yüklenen avatarı doğrulayıp `directory` içine kaydet.
+
+    Küçük, 512x512 sınırına uyan ve EXIF içermeyen dosyalar doğrulanıp olduğu gibi
+    kaydedilir; diğerleri EXIF yönüne göre
+    döndürülür, en fazla 512x512 olacak şekilde küçültülüp WebP olarak yeniden kodlanır.
+    Geçersiz ya da çok büyük görsellerde OSError / ValueError fırlatır. Kaydedilen dosya adını döndürür.
+    """
+    stream = file_storage.stream
+    image = Image.open(stream)
+    width, height = image.size
+    if width * height > AVATAR_MAX_PIXELS:
+        raise ValueError("Avatar görseli çok büyük")
+    extension = _AVATAR_FORMAT_EXTENSIONS.get(image.format)
+    if (
+        size <= AVATAR_PASSTHROUGH_BYTES
+        and extension is not None
+        and width <= AVATAR_MAX_DIMENSIONS[0]
+        and height <= AVATAR_MAX_DIMENSIONS[1]
+    ):
+        image.verify()
+        # verify() görseli kullanılamaz bırakır; EXIF (konum vb.) kontrolü için yeniden açılır
+        stream.seek(0)
+        image = Image.open(stream)
+        if not image.getexif():
+            stream.seek(0)
+            filename = secure_filename(f"{basename}.{extension}")
+            file_storage.save(os.path.join(directory, filename))
+            return filename
+
+    # JPEG'ler doğrudan küçültülmüş ölçekte çözülür; diğer biçimlerde etkisizdir
+    image.draft("RGB", AVATAR_MAX_DIMENSIONS)
+    # WebP'ye EXIF taşınmadığı için telefon fotoğraflarının yönü piksellere uygulanır
+    image = ImageOps.exif_transpose(image)
+    # Paletli görseller küçültmeden önce dönüştürülür; aksi halde ölçekleme bloklu görünür
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+    image.thumbnail(AVATAR_MAX_DIMENSIONS)
+    filename = secure_filename(f"{basename}.webp")
+    image.save(os.path.join(directory, filename), "WEBP", quality=85)
+    return filename
+
 
 def _generate_password_salt(length: int = _PASSWORD_SALT_LENGTH) -> str:
-    return "".join(_SYS_RANDOM.choice(_PASSWORD_HASH_CHARS) for _ in range(length))
+    # token_urlsafe reads OS entropy once; the URL-safe alphabet never contains
+    # "$", and existing hashes keep verifying because the salt is stored inline.
+    return secrets.token_urlsafe(length)[:length]
 
 
 def _pbkdf2_encode(password: str, salt: str, iterations: int, hash_name: str) -> str:
@@ -450,10 +686,13 @@ def _pbkdf2_encode(password: str, salt: str, iterations: int, hash_name: str) ->
 
 def generate_password_hash(password: str, salt_length: int = _PASSWORD_SALT_LENGTH) -> str:
     """
-    Generate a PBKDF2 based password hash compatible with Werkzeug's default output.
+    Generate an Argon2id hash when PASSWORD_HASH_SCHEME is "argon2" and argon2-cffi
+    is installed, otherwise a PBKDF2 hash compatible with Werkzeug's default output.
     """
     if not isinstance(password, str):
         raise TypeError("password must be a string")
+    if _ARGON2_HASHER is not None and get_config().PASSWORD_HASH_SCHEME == "argon2":
+        return _ARGON2_HASHER.hash(password)
     salt = _generate_password_salt(salt_length)
     iterations = _PASSWORD_DEFAULT_ITERATIONS
     hash_name = _PASSWORD_HASH_NAME
@@ -462,16 +701,19 @@ def generate_password_hash(password: str, salt_length: int = _PASSWORD_SALT_LENG
     return f"{method}${salt}${hash_value}"
 
 
+@lru_cache(maxsize=16)
 def _parse_method_descriptor(descriptor: str) -> Optional[Tuple[str, int]]:
     """Return (hash_name, iterations) for pbkdf2 descriptors."""
-    parts = descriptor.split(":")
-    if not parts or parts[0] != _PASSWORD_HASH_METHOD:
+    method, sep, rest = descriptor.partition(":")
+    if method != _PASSWORD_HASH_METHOD:
         return None
-    hash_name = parts[1] if len(parts) > 1 else _PASSWORD_HASH_NAME
+    if not sep:
+        return _PASSWORD_HASH_NAME, _PASSWORD_DEFAULT_ITERATIONS
+    hash_name, sep, rest = rest.partition(":")
+    if not sep:
+        return hash_name, _PASSWORD_DEFAULT_ITERATIONS
     try:
-        iterations = (
-            int(parts[2]) if len(parts) > 2 else _PASSWORD_DEFAULT_ITERATIONS
-        )
+        iterations = int(rest.partition(":")[0])
     except ValueError:
         return None
     return hash_name, iterations
@@ -479,11 +721,19 @@ def _parse_method_descriptor(descriptor: str) -> Optional[Tuple[str, int]]:
 
 def check_password_hash(pwhash: str, password: str) -> bool:
     """
-    Validate a password against an encoded PBKDF2 hash.
+    Validate a password against an encoded Argon2id or PBKDF2 hash.
     Supports hashes generated by Werkzeug defaults and this module.
     """
     if not pwhash or "$" not in pwhash:
         return False
+    if pwhash.startswith(_ARGON2_PREFIX):
+        if _ARGON2_HASHER is None:
+            logger.error("Argon2 password hash found but argon2-cffi is not installed")
+            return False
+        try:
+            return _ARGON2_HASHER.verify(pwhash, password)
+        except (VerificationError, InvalidHashError):
+            return False
     try:
         descriptor, salt, stored_hash = pwhash.split("$", 2)
     except ValueError:
@@ -497,6 +747,23 @@ def check_password_hash(pwhash: str, password: str) -> bool:
     return hmac.compare_digest(stored_hash, calculated)
 
 
+def password_needs_rehash(pwhash: str) -> bool:
+    """
+    Return True when a verified hash does not match the configured PASSWORD_HASH_SCHEME
+    or uses weaker parameters than the current defaults.
+    """
+    if pwhash.startswith(_ARGON2_PREFIX):
+        if _ARGON2_HASHER is None:
+            return False
+        if get_config().PASSWORD_HASH_SCHEME != "argon2":
+            return True
+        return _ARGON2_HASHER.check_needs_rehash(pwhash)
+    if _ARGON2_HASHER is not None and get_config().PASSWORD_HASH_SCHEME == "argon2":
+        return True
+    parsed = _parse_method_descriptor(pwhash.partition("$")[0])
+    return parsed is None or parsed[1] < _PASSWORD_DEFAULT_ITERATIONS
+
+
 def create_app() -> Flask:
     """Flask uygulamasını oluştur ve yapılandır."""
     app = Flask(__name__)
@@ -505,6 +772,27 @@ def create_app() -> Flask:
     config = get_config()
     app.config.from_object(config)
     
+    # Jinja: derlenmiş şablonları yeniden başlatmalar arasında diskte tut
+    bytecode_dir = app.config["JINJA_BYTECODE_CACHE_DIR"]
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, mode=0o700, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory=bytecode_dir)
+
+    # Avatar dizini açılışta bir kez oluşturulur
+    app.config["AVATARS_DIR"] = os.path.join(app.root_path, "static", "avatars")
+    os.makedirs(app.config["AVATARS_DIR"], exist_ok=True)
+    
+    # TCKN cipher'ını ilk istekte değil, açılışta bir kez hazırla
+    get_identity_cipher()
+    
+    # Sunucu taraflı oturum: yapılandırılmışsa sepet her istekte çerezle taşınmaz
+    if app.config.get("SESSION_TYPE") == "redis":
+        if ServerSideSession is None:
+            logger.warning("SESSION_TYPE=redis fakat Flask-Session/redis kurulu değil; çerez tabanlı oturum kullanılıyor")
+        else:
+            app.config["SESSION_REDIS"] = redis.from_url(app.config["SESSION_REDIS_URL"])
+            ServerSideSession(app)
+    
     # Initialize extensions
     csrf = CSRFProtect(app)
     
@@ -534,6 +822,8 @@ def create_app() -> Flask:
     # MongoDB with connection pooling
     app.mongo_client = create_mongo_client()
     app.db = resolve_database(app.mongo_client)
+    # İlk kullanıcı oluştuktan sonra True kalır; kayıt sayfası her istekte sayım yapmaz
+    app.has_any_user = False
     
     # Create database indexes for performance
     create_database_indexes(app.db)
@@ -581,7 +871,7 @@ def create_app() -> Flask:
     
     @app.before_request
     def _load_locale():
-        locale = session.get("lang") or request.accept_languages.best_match(SUPPORTED_LOCALES)
+        locale = session.get("lang") or _best_locale(request.headers.get("Accept-Language", ""))
         g.locale = locale if locale in SUPPORTED_LOCALES else DEFAULT_LOCALE
 
     def translate(key: str) -> str:
@@ -615,7 +905,14 @@ def app_config(name: str) -> Optional[str]:
 
 
 def create_mongo_client() -> MongoClient:
-    """MongoDB istemcisini connection pooling ile hazırla."""
+    """
+    MongoDB istemcisini connection pooling ile hazırla.
+    Aynı süreçte create_app tekrar çağrılırsa mevcut istemci (ve havuzu) yeniden kullanılır.
+    """
+    global _mongo_client
+    if _mongo_client is not None:
+        return _mongo_client
+
     config = get_config()
     uri = config.MONGO_URI
     
@@ -624,6 +921,9 @@ def create_mongo_client() -> MongoClient:
             uri,
             maxPoolSize=config.MONGO_MAX_POOL_SIZE,
             minPoolSize=config.MONGO_MIN_POOL_SIZE,
+            waitQueueTimeoutMS=config.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            compressors=config.MONGO_COMPRESSORS,
+            uuidRepresentation="standard",
             serverSelectionTimeoutMS=5000,
             connectTimeoutMS=10000,
             socketTimeoutMS=20000,
@@ -638,6 +938,7 @@ def create_mongo_client() -> MongoClient:
             logger.warning(f"MongoDB connection warning: {str(conn_error)}")
             logger.warning("Continuing with connection (may work despite warning)")
         
+        _mongo_client = client
         return client
     except Exception as e:
         error_msg = str(e)
@@ -685,6 +986,13 @@ def create_database_indexes(db):
         db.users.create_index([("identity_number_hash", ASCENDING)], unique=True)
         db.users.create_index([("referral_code", ASCENDING)], unique=True)
         db.users.create_index([("sponsor_id", ASCENDING)])
+        db.users.create_index(
+            [
+                ("placement_parent_id", ASCENDING),
+                ("placement_status", ASCENDING),
+                ("placement_position", ASCENDING),
+            ]
+        )
         db.users.create_index([("created_at", DESCENDING)])
         
         # Products collection indexes
@@ -693,7 +1001,8 @@ def create_database_indexes(db):
         db.products.create_index([("created_at", DESCENDING)])
         
         # Orders collection indexes
-        db.orders.create_index([("user_id", ASCENDING)])
+        # (user_id, created_at) ön eki tek başına user_id sorgularını da karşılar
+        db.orders.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
         db.orders.create_index([("created_at", DESCENDING)])
         db.orders.create_index([("status", ASCENDING)])
         
@@ -709,6 +1018,23 @@ def create_database_indexes(db):
         logger.warning(f"Index creation warning (may already exist): {str(e)}")
 
 
+@lru_cache(maxsize=4096)
+def _session_object_id(user_id: str) -> ObjectId:
+    """Oturumdaki kullanıcı kimliğini ObjectId'ye çevir (ObjectId değişmez, paylaşılabilir)."""
+    return ObjectId(user_id)
+
+
+def cached_page_response(page: str, etag: str):
+    """
+    Önbellekteki anonim sayfayı zayıf ETag ile döndür.
+    Tarayıcı her seferinde doğrular; içerik değişmediyse 304 ile gövde gönderilmez.
+    """
+    response = make_response(page)
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
 def register_db_helpers(app: Flask) -> None:
     """Veri tabanına erişim ve oturum yardımcılarını hazırla."""
 
@@ -717,17 +1043,25 @@ def register_db_helpers(app: Flask) -> None:
         user_id = session.get("user_id")
         g.user = None
 
-        if user_id:
+        if not user_id:
+            return
+        if ObjectId.is_valid(user_id):
             try:
-                g.user = app.db.users.find_one({"_id": ObjectId(user_id)})
-            except Exception:
-                session.pop("user_id", None)
-                g.user = None
+                g.user = app.db.users.find_one({"_id": _session_object_id(user_id)})
+            except PyMongoError as e:
+                # Geçici veritabanı hatasında oturumu kapatma; bu istek anonim işlenir
+                logger.error(f"Error loading session user: {str(e)}")
+                return
+        if g.user is None:
+            session.pop("user_id", None)
 
     @app.context_processor
     def inject_globals():
-        cart: List[Dict] = session.get("cart", [])
-        cart_count = sum(item.get("quantity", 0) for item in cart)
+        cart_count = session.get("cart_count")
+        if cart_count is None:
+            # Sepeti olmayan ziyaretçiler için doğrudan 0; cart_count alanı olmayan
+            # eski oturumlarda bir kez hesapla.
+            cart_count = sum(get_session_cart().values()) if "cart" in session else 0
         current_user = getattr(g, "user", None)
         announcements: List[Dict[str, Any]] = []
         try:
@@ -816,96 +1150,6 @@ def login_required(view):
 def register_routes(app: Flask) -> None:
     """Tüm Flask rotalarını kaydet."""
 
-    COUNTRY_OPTIONS: List[Dict[str, str]] = [
-        {"dial_code": "90", "name": "Türkiye"},
-    ]
-
-    PROVINCES: Dict[str, List[str]] = {
-        "Adana": ["Aladağ", "Ceyhan", "Çukurova", "Feke", "İmamoğlu", "Karaisalı", "Karataş", "Kozan", "Pozantı", "Saimbeyli", "Sarıçam", "Seyhan", "Tufanbeyli", "Yumurtalık", "Yüreğir"],
-        "Adıyaman": ["Besni", "Çelikhan", "Gerger", "Gölbaşı", "Kahta", "Merkez", "Samsat", "Sincik", "Tut"],
-        "Afyonkarahisar": ["Başmakçı", "Bayat", "Bolvadin", "Çay", "Çobanlar", "Dazkırı", "Dinar", "Emirdağ", "Evciler", "Hocalar", "İhsaniye", "İscehisar", "Kızılören", "Merkez", "Sandıklı", "Sinanpaşa", "Sultandağı", "Şuhut"],
-        "Ağrı": ["Diyadin", "Doğubayazıt", "Eleşkirt", "Hamur", "Merkez", "Patnos", "Taşlıçay", "Tutak"],
-        "Aksaray": ["Ağaçören", "Aksaray", "Eskil", "Gülağaç", "Güzelyurt", "Ortaköy", "Sarıyahşi"],
-        "Amasya": ["Göynücek", "Gümüşhacıköy", "Hamamözü", "Merkez", "Merzifon", "Suluova", "Taşova"],
-        "Ankara": ["Akyurt", "Altındağ", "Ayaş", "Balâ", "Beypazarı", "Çamlıdere", "Çankaya", "Çubuk", "Elmadağ", "Etimesgut", "Evren", "Gölbaşı", "Güdül", "Haymana", "Kahramankazan", "Kalecik", "Keçiören", "Kızılcahamam", "Mamak", "Nallıhan", "Polatlı", "Pursaklar", "Sincan", "Şereflikoçhisar", "Yenimahalle"],
-        "Antalya": ["Akseki", "Aksu", "Alanya", "Demre", "Döşemealtı", "Elmalı", "Finike", "Gazipaşa", "Gündoğmuş", "İbradı", "Kaş", "Kemer", "Kepez", "Konyaaltı", "Korkuteli", "Kumluca", "Manavgat", "Muratpaşa", "Serik"],
-        "Artvin": ["Ardanuç", "Arhavi", "Borçka", "Hopa", "Kemalpaşa", "Merkez", "Murgul", "Şavşat", "Yusufeli"],
-        "Ardahan": ["Çıldır", "Damal", "Göle", "Hanak", "Merkez", "Posof"],
-        "Aydın": ["Bozdoğan", "Buharkent", "Çine", "Didim", "Efeler", "Germencik", "İncirliova", "Karacasu", "Karpuzlu", "Koçarlı", "Köşk", "Kuşadası", "Kuyucak", "Nazilli", "Söke", "Sultanhisar", "Yenipazar"],
-        "Balıkesir": ["Altıeylül", "Ayvalık", "Balya", "Bandırma", "Bigadiç", "Burhaniye", "Dursunbey", "Edremit", "Erdek", "Gömeç", "Gönen", "Havran", "İvrindi", "Karesi", "Kepsut", "Manyas", "Marmara", "Savaştepe", "Sındırgı", "Susurluk"],
-        "Bartın": ["Amasra", "Kurucaşile", "Merkez", "Ulus"],
-        "Batman": ["Beşiri", "Gercüş", "Hasankeyf", "Kozluk", "Merkez", "Sason"],
-        "Bayburt": ["Aydıntepe", "Demirözü", "Merkez"],
-        "Bilecik": ["Bozüyük", "Gölpazarı", "İnhisar", "Merkez", "Osmaneli", "Pazaryeri", "Söğüt", "Yenipazar"],
-        "Bingöl": ["Adaklı", "Genç", "Karlıova", "Kığı", "Merkez", "Solhan", "Yayladere", "Yedisu"],
-        "Bitlis": ["Adilcevaz", "Ahlat", "Güroymak", "Hizan", "Merkez", "Mutki", "Tatvan"],
-        "Bolu": ["Dörtdivan", "Gerede", "Göynük", "Kıbrıscık", "Mengen", "Merkez", "Mudurnu", "Seben", "Yeniçağa"],
-        "Burdur": ["Ağlasun", "Altınyayla", "Bucak", "Çavdır", "Çeltikçi", "Gölhisar", "Karamanlı", "Kemer", "Merkez", "Tefenni", "Yeşilova"],
-        "Bursa": ["Büyükorhan", "Gemlik", "Gürsu", "Harmancık", "İnegöl", "İznik", "Karacabey", "Keles", "Kestel", "Mudanya", "Mustafakemalpaşa", "Nilüfer", "Orhaneli", "Orhangazi", "Osmangazi", "Yenişehir", "Yıldırım"],
-        "Çanakkale": ["Ayvacık", "Bayramiç", "Biga", "Bozcaada", "Çan", "Eceabat", "Ezine", "Gelibolu", "Gökçeada", "Lapseki", "Merkez", "Yenice"],
-        "Çankırı": ["Atkaracalar", "Bayramören", "Çerkeş", "Eldivan", "Ilgaz", "Kızılırmak", "Korgun", "Kurşunlu", "Merkez", "Orta", "Şabanözü", "Yapraklı"],
-        "Çorum": ["Alaca", "Bayat", "Boğazkale", "Dodurga", "İskilip", "Kargı", "Laçin", "Mecitözü", "Merkez", "Oğuzlar", "Osmancık", "Sungurlu", "Uğurludağ"],
-        "Denizli": ["Acıpayam", "Babadağ", "Baklan", "Bekilli", "Beyağaç", "Bozkurt", "Buldan", "Çal", "Çameli", "Çardak", "Çivril", "Güney", "Honaz", "Kale", "Merkezefendi", "Pamukkale", "Sarayköy", "Serinhisar", "Tavas"],
-        "Diyarbakır": ["Bağlar", "Bismil", "Çermik", "Çınar", "Çüngüş", "Dicle", "Eğil", "Ergani", "Hani", "Hazro", "Kayapınar", "Kocaköy", "Kulp", "Lice", "Silvan", "Sur", "Yenişehir"],
-        "Düzce": ["Akçakoca", "Cumayeri", "Çilimli", "Gölyaka", "Gümüşova", "Kaynaşlı", "Merkez", "Yığılca"],
-        "Edirne": ["Enez", "Havsa", "İpsala", "Keşan", "Lalapaşa", "Meriç", "Merkez", "Süloğlu", "Uzunköprü"],
-        "Elazığ": ["Ağın", "Alacakaya", "Arıcak", "Baskil", "Karakoçan", "Keban", "Kovancılar", "Maden", "Merkez", "Palu", "Sivrice"],
-        "Erzincan": ["Çayırlı", "İliç", "Kemah", "Kemaliye", "Merkez", "Otlukbeli", "Refahiye", "Tercan", "Üzümlü"],
-        "Erzurum": ["Aşkale", "Aziziye", "Çat", "Hınıs", "Horasan", "İspir", "Karaçoban", "Karayazı", "Köprüköy", "Narman", "Oltu", "Olur", "Palandöken", "Pasinler", "Pazaryolu", "Şenkaya", "Tekman", "Tortum", "Uzundere", "Yakutiye"],
-        "Eskişehir": ["Alpu", "Beylikova", "Çifteler", "Günyüzü", "Han", "İnönü", "Mahmudiye", "Mihalgazi", "Mihalıççık", "Odunpazarı", "Sarıcakaya", "Seyitgazi", "Sivrihisar", "Tepebaşı"],
-        "Gaziantep": ["Araban", "İslahiye", "Karkamış", "Nizip", "Nurdağı", "Oğuzeli", "Şahinbey", "Şehitkamil", "Yavuzeli"],
-        "Giresun": ["Alucra", "Bulancak", "Çamoluk", "Çanakçı", "Dereli", "Doğankent", "Espiye", "Eynesil", "Görele", "Güce", "Keşap", "Merkez", "Piraziz", "Şebinkarahisar", "Tirebolu", "Yağlıdere"],
-        "Gümüşhane": ["Kelkit", "Köse", "Kürtün", "Merkez", "Şiran", "Torul"],
-        "Hakkari": ["Çukurca", "Derecik", "Merkez", "Şemdinli", "Yüksekova"],
-        "Hatay": ["Altınözü", "Antakya", "Arsuz", "Belen", "Defne", "Dörtyol", "Erzin", "Hassa", "İskenderun", "Kırıkhan", "Kumlu", "Payas", "Reyhanlı", "Samandağ", "Yayladağı"],
-        "Iğdır": ["Aralık", "Karakoyunlu", "Merkez", "Tuzluca"],
-        "Isparta": ["Aksu", "Atabey", "Eğirdir", "Gelendost", "Gönen", "Keçiborlu", "Merkez", "Senirkent", "Sütçüler", "Şarkikaraağaç", "Uluborlu", "Yalvaç", "Yenişarbademli"],
-        "İstanbul": ["Adalar", "Arnavutköy", "Ataşehir", "Avcılar", "Bağcılar", "Bahçelievler", "Bakırköy", "Başakşehir", "Bayrampaşa", "Beşiktaş", "Beykoz", "Beylikdüzü", "Beyoğlu", "Büyükçekmece", "Çatalca", "Çekmeköy", "Esenler", "Esenyurt", "Eyüpsultan", "Fatih", "Gaziosmanpaşa", "Güngören", "Kadıköy", "Kağıthane", "Kartal", "Küçükçekmece", "Maltepe", "Pendik", "Sancaktepe", "Sarıyer", "Silivri", "Sultanbeyli", "Sultangazi", "Şile", "Şişli", "Tuzla", "Ümraniye", "Üsküdar", "Zeytinburnu"],
-        "İzmir": ["Aliağa", "Balçova", "Bayındır", "Bayraklı", "Bergama", "Beydağ", "Bornova", "Buca", "Çeşme", "Çiğli", "Dikili", "Foça", "Gaziemir", "Güzelbahçe", "Karabağlar", "Karaburun", "Karşıyaka", "Kemalpaşa", "Kınık", "Kiraz", "Konak", "Menderes", "Menemen", "Narlıdere", "Ödemiş", "Seferihisar", "Selçuk", "Tire", "Torbalı", "Urla"],
-        "Kahramanmaraş": ["Afşin", "Andırın", "Çağlayancerit", "Dulkadiroğlu", "Ekinözü", "Elbistan", "Göksun", "Nurhak", "Onikişubat", "Pazarcık", "Türkoğlu"],
-        "Karabük": ["Eflani", "Eskipazar", "Karabük", "Ovacık", "Safranbolu", "Yenice"],
-        "Karaman": ["Ayrancı", "Başyayla", "Ermenek", "Karaman", "Kazımkarabekir", "Sarıveliler"],
-        "Kars": ["Akyaka", "Arpaçay", "Digor", "Kağızman", "Merkez", "Sarıkamış", "Selim", "Susuz"],
-        "Kastamonu": ["Abana", "Ağlı", "Araç", "Azdavay", "Bozkurt", "Cide", "Çatalzeytin", "Daday", "Devrekani", "Doğanyurt", "Hanönü", "İhsangazi", "İnebolu", "Küre", "Merkez", "Pınarbaşı", "Seydiler", "Şenpazar", "Taşköprü", "Tosya"],
-        "Kayseri": ["Akkışla", "Bünyan", "Develi", "Felahiye", "Hacılar", "İncesu", "Kocasinan", "Melikgazi", "Özvatan", "Pınarbaşı", "Sarıoğlan", "Sarız", "Talas", "Tomarza", "Yahyalı", "Yeşilhisar"],
-        "Kırıkkale": ["Bahşılı", "Balışeyh", "Çelebi", "Delice", "Karakeçili", "Keskin", "Merkez", "Sulakyurt", "Yahşihan"],
-        "Kırklareli": ["Babaeski", "Demirköy", "Kofçaz", "Lüleburgaz", "Merkez", "Pehlivanköy", "Pınarhisar", "Vize"],
-        "Kırşehir": ["Akçakent", "Akpınar", "Boztepe", "Çiçekdağı", "Kaman", "Merkez", "Mucur"],
-        "Kilis": ["Elbeyli", "Merkez", "Musabeyli", "Polateli"],
-        "Kocaeli": ["Başiskele", "Çayırova", "Darıca", "Derince", "Dilovası", "Gebze", "Gölcük", "İzmit", "Kandıra", "Karamürsel", "Kartepe", "Körfez"],
-        "Konya": ["Ahırlı", "Akören", "Akşehir", "Altınekin", "Beyşehir", "Bozkır", "Cihanbeyli", "Çeltik", "Çumra", "Derbent", "Derebucak", "Doğanhisar", "Emirgazi", "Ereğli", "Güneysınır", "Hadım", "Halkapınar", "Hüyük", "Ilgın", "Kadınhanı", "Karapınar", "Karatay", "Kulu", "Meram", "Sarayönü", "Selçuklu", "Seydişehir", "Taşkent", "Tuzlukçu", "Yalıhüyük", "Yunak"],
-        "Kütahya": ["Altıntaş", "Aslanapa", "Çavdarhisar", "Domaniç", "Dumlupınar", "Emet", "Gediz", "Hisarcık", "Merkez", "Pazarlar", "Simav", "Şaphane", "Tavşanlı"],
-        "Malatya": ["Akçadağ", "Arapgir", "Arguvan", "Battalgazi", "Darende", "Doğanşehir", "Doğanyol", "Hekimhan", "Kale", "Kuluncak", "Pütürge", "Yazıhan", "Yeşilyurt"],
-        "Manisa": ["Ahmetli", "Akhisar", "Alaşehir", "Demirci", "Gölmarmara", "Gördes", "Kırkağaç", "Köprübaşı", "Kula", "Salihli", "Sarıgöl", "Saruhanlı", "Selendi", "Soma", "Şehzadeler", "Turgutlu", "Yunusemre"],
-        "Mardin": ["Artuklu", "Dargeçit", "Derik", "Kızıltepe", "Mazıdağı", "Midyat", "Nusaybin", "Ömerli", "Savur", "Yeşilli"],
-        "Mersin": ["Akdeniz", "Anamur", "Aydıncık", "Bozyazı", "Çamlıyayla", "Erdemli", "Gülnar", "Mezitli", "Mut", "Silifke", "Tarsus", "Toroslar", "Yenişehir"],
-        "Muğla": [
-            "Bodrum", "Dalaman", "Datça", "Fethiye", "Kavaklıdere", "Köyceğiz", "Marmaris", "Menteşe", "Milas", "Ortaca", "Seydikemer", "Ula", "Yatağan"
-        ],
-        "Muş": ["Bulanık", "Hasköy", "Korkut", "Malazgirt", "Merkez", "Varto"],
-        "Nevşehir": ["Acıgöl", "Avanos", "Derinkuyu", "Gülşehir", "Hacıbektaş", "Kozaklı", "Merkez", "Ürgüp"],
-        "Niğde": ["Altunhisar", "Bor", "Çamardı", "Çiftlik", "Merkez", "Ulukışla"],
-        "Ordu": ["Akkuş", "Altınordu", "Aybastı", "Çamaş", "Çatalpınar", "Çaybaşı", "Fatsa", "Gölköy", "Gülyalı", "Gürgentepe", "İkizce", "Kabadüz", "Kabataş", "Korgan", "Kumru", "Mesudiye", "Perşembe", "Ulubey", "Ünye"],
-        "Osmaniye": ["Bahçe", "Düziçi", "Kadirli", "Merkez", "Sumbas", "Toprakkale"],
-        "Rize": ["Ardeşen", "Çamlıhemşin", "Çayeli", "Derepazarı", "Fındıklı", "Güneysu", "Hemşin", "İkizdere", "İyidere", "Kalkandere", "Merkez", "Pazar"],
-        "Sakarya": ["Adapazarı", "Akyazı", "Arifiye", "Erenler", "Ferizli", "Geyve", "Hendek", "Karapürçek", "Karasu", "Kaynarca", "Kocaali", "Pamukova", "Sapanca", "Serdivan", "Söğütlü", "Taraklı"],
-        "Samsun": ["Alaçam", "Asarcık", "Atakum", "Ayvacık", "Bafra", "Canik", "Çarşamba", "Havza", "İlkadım", "Kavak", "Ladik", "Ondokuzmayıs", "Salıpazarı", "Tekkeköy", "Terme", "Vezirköprü", "Yakakent"],
-        "Siirt": ["Baykan", "Eruh", "Kurtalan", "Merkez", "Pervari", "Şirvan", "Tillo"],
-        "Sinop": ["Ayancık", "Boyabat", "Dikmen", "Durağan", "Erfelek", "Gerze", "Merkez", "Saraydüzü", "Türkeli"],
-        "Sivas": ["Akıncılar", "Altınyayla", "Divriği", "Doğanşar", "Gemerek", "Gölova", "Gürün", "Hafik", "İmranlı", "Kangal", "Koyulhisar", "Merkez", "Suşehri", "Şarkışla", "Ulaş", "Yıldızeli", "Zara"],
-        "Şanlıurfa": ["Akçakale", "Birecik", "Bozova", "Ceylanpınar", "Eyyübiye", "Halfeti", "Haliliye", "Harran", "Hilvan", "Karaköprü", "Siverek", "Suruç", "Viranşehir"],
-        "Şırnak": ["Beytüşşebap", "Cizre", "Güçlükonak", "İdil", "Merkez", "Silopi", "Uludere"],
-        "Tekirdağ": ["Çerkezköy", "Çorlu", "Ergene", "Hayrabolu", "Kapaklı", "Malkara", "Marmaraereğlisi", "Muratlı", "Saray", "Süleymanpaşa", "Şarköy"],
-        "Tokat": ["Almus", "Artova", "Başçiftlik", "Erbaa", "Merkez", "Niksar", "Pazar", "Reşadiye", "Sulusaray", "Turhal", "Yeşilyurt", "Zile"],
-        "Trabzon": ["Akçaabat", "Araklı", "Arsin", "Beşikdüzü", "Çarşıbaşı", "Çaykara", "Dernekpazarı", "Düzköy", "Hayrat", "Köprübaşı", "Maçka", "Of", "Ortahisar", "Sürmene", "Şalpazarı", "Tonya", "Vakfıkebir", "Yomra"],
-        "Tunceli": ["Çemişgezek", "Hozat", "Mazgirt", "Merkez", "Nazımiye", "Ovacık", "Pertek", "Pülümür"],
-        "Uşak": ["Banaz", "Eşme", "Karahallı", "Merkez", "Sivaslı", "Ulubey"] ,
-        "Van": ["Bahçesaray", "Başkale", "Çaldıran", "Çatak", "Edremit", "Erciş", "Gevaş", "Gürpınar", "İpekyolu", "Muradiye", "Özalp", "Saray", "Tuşba"],
-        "Yalova": ["Altınova", "Armutlu", "Çınarcık", "Çiftlikköy", "Merkez", "Termal"],
-        "Yozgat": ["Akdağmadeni", "Aydıncık", "Boğazlıyan", "Çandır", "Çayıralan", "Çekerek", "Kadışehri", "Merkez", "Saraykent", "Sarıkaya", "Şefaatli", "Sorgun", "Yenifakılı", "Yerköy"],
-        "Zonguldak": ["Alaplı", "Çaycuma", "Devrek", "Ereğli", "Gökçebey", "Kilimli", "Kozlu", "Merkez"],
-    }
-
     def ensure_sample_products():
         if app.db.products.count_documents({}) == 0:
             app.db.products.insert_many(
@@ -966,6 +1210,9 @@ def register_routes(app: Flask) -> None:
     # Create default admin if not exists
     create_default_admin(app, username='admin', password='admin123')
 
+    # Örnek ürünleri açılışta bir kez ekle; sayfa isteklerinde sayım yapılmaz
+    ensure_sample_products()
+
     @app.route("/bestsoft/panel")
     @app.route("/bestsoft/panel/")
     def bestsoft_panel():
@@ -1088,12 +1335,9 @@ def register_routes(app: Flask) -> None:
 
     @app.route("/")
     def index():
-        ensure_sample_products()
-        products = []
-        for product in app.db.products.find():
-            product_data = dict(product)
-            product_data["id"] = str(product["_id"])
-            products.append(product_data)
+        products = list(app.db.products.find({}, PRODUCT_CARD_PROJECTION).batch_size(100))
+        for product in products:
+            product["id"] = str(product["_id"])
 
         slider_images_cursor = app.db.bestsoft_slider_images.find().sort(
             [("display_order", 1), ("created_at", -1)]
@@ -1158,7 +1402,7 @@ def register_routes(app: Flask) -> None:
             or DEFAULT_CONTACT_ADDRESS
         )
         map_query_target = contact_address or contact_company_name or DEFAULT_CONTACT_COMPANY
-        normalized_phone_href = "".join(ch for ch in contact_phone if ch.isdigit() or ch == "+")
+        normalized_phone_href = _NON_PHONE_RE.sub("", contact_phone)
         contact_info = {
             "company_name": contact_company_name,
             "email": contact_email,
@@ -1208,7 +1452,6 @@ def register_routes(app: Flask) -> None:
 
     @app.route("/eshop")
     def eshop():
-        ensure_sample_products()
         product_cursor = app.db.products.find()
         products = []
         category_counts: Dict[str, int] = {}
@@ -1241,8 +1484,9 @@ def register_routes(app: Flask) -> None:
 
     @app.route("/register", methods=["GET", "POST"])
     def register():
-        total_users = app.db.users.count_documents({})
-        requires_referral = total_users > 0
+        if not app.has_any_user:
+            app.has_any_user = app.db.users.count_documents({}, limit=1) > 0
+        requires_referral = app.has_any_user
 
         sponsor_info: Optional[Dict[str, str]] = None
 
@@ -1272,54 +1516,52 @@ def register_routes(app: Flask) -> None:
             agreement_distributor = request.form.get("agreement_distributor") is not None
             agreement_kvkk = request.form.get("agreement_kvkk") is not None
 
-            province_list = list(PROVINCES.keys())
-
-            form_state = {
-                "first_name": first_name,
-                "last_name": last_name,
-                "email": email,
-                "phone": phone,
-                "identity_number": identity_number,
-                "membership_type": membership_type,
-                "dob_day": dob_day,
-                "dob_month": dob_month,
-                "dob_year": dob_year,
-                "gender": gender,
-                "is_foreign": is_foreign,
-                "city": city,
-                "district": district,
-                "neighborhood": neighborhood,
-                "tax_office": tax_office,
-                "tax_number": tax_number,
-                "postal_code": postal_code,
-                "address": address,
-                "agreement_distributor": agreement_distributor,
-                "agreement_kvkk": agreement_kvkk,
-            }
-
             selected_country = country_code or (COUNTRY_OPTIONS[0]["dial_code"] if COUNTRY_OPTIONS else "")
 
-            if sponsor_code and sponsor_info is None:
-                sponsor_lookup = app.db.users.find_one({"referral_code": sponsor_code})
-                if sponsor_lookup:
-                    sponsor_info = {
-                        "name": sponsor_lookup.get("name", ""),
-                        "referral_code": sponsor_lookup.get("referral_code"),
-                    }
+            # Sponsor tek sorguda alınır; hem form hem yerleşim bu belgeyi kullanır
+            sponsor_doc = (
+                app.db.users.find_one({"referral_code": sponsor_code}, SPONSOR_PROJECTION)
+                if sponsor_code
+                else None
+            )
+            if sponsor_doc:
+                sponsor_info = {
+                    "name": sponsor_doc.get("name", ""),
+                    "referral_code": sponsor_doc.get("referral_code"),
+                }
 
             def render_form() -> str:
-                context = {
-                    "countries": COUNTRY_OPTIONS,
-                    "province_list": province_list,
-                    "province_map": PROVINCES,
-                    "selected_country": selected_country,
-                    "requires_referral": requires_referral,
-                    "sponsor_code": sponsor_code,
-                    "sponsor_info": sponsor_info,
-                    "datetime": datetime,
-                }
-                context.update(form_state)
-                return render_template("auth/register.html", **context)
+                return render_template(
+                    "auth/register.html",
+                    countries=COUNTRY_OPTIONS,
+                    province_list=PROVINCE_LIST,
+                    province_map_json=PROVINCES_JSON,
+                    selected_country=selected_country,
+                    requires_referral=requires_referral,
+                    sponsor_code=sponsor_code,
+                    sponsor_info=sponsor_info,
+                    datetime=datetime,
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=email,
+                    phone=phone,
+                    identity_number=identity_number,
+                    membership_type=membership_type,
+                    dob_day=dob_day,
+                    dob_month=dob_month,
+                    dob_year=dob_year,
+                    gender=gender,
+                    is_foreign=is_foreign,
+                    city=city,
+                    district=district,
+                    neighborhood=neighborhood,
+                    tax_office=tax_office,
+                    tax_number=tax_number,
+                    postal_code=postal_code,
+                    address=address,
+                    agreement_distributor=agreement_distributor,
+                    agreement_kvkk=agreement_kvkk,
+                )
 
             if not first_name or not last_name or not email or not phone or not identity_number or not password or not country_code:
                 flash("Lütfen tüm zorunlu alanları doldurun.", "error")
@@ -1333,7 +1575,7 @@ def register_routes(app: Flask) -> None:
                 flash("Lütfen şehir ve ilçe seçin.", "error")
                 return render_form()
 
-            if city not in PROVINCES or district not in PROVINCES.get(city, []):
+            if district not in PROVINCE_DISTRICT_SET.get(city, ()):
                 flash("Geçerli bir il ve ilçe kombinasyonu seçiniz.", "error")
                 return render_form()
 
@@ -1347,7 +1589,7 @@ def register_routes(app: Flask) -> None:
                 flash("Lütfen sözleşmeleri onaylayın.", "error")
                 return render_form()
 
-            valid_country = next((c for c in COUNTRY_OPTIONS if c["dial_code"] == country_code), None)
+            valid_country = COUNTRY_BY_DIAL.get(country_code)
             if valid_country is None:
                 flash("Geçerli bir ülke seçiniz.", "error")
                 return render_form()
@@ -1356,30 +1598,38 @@ def register_routes(app: Flask) -> None:
                 flash("Şifreler eşleşmiyor.", "error")
                 return render_form()
 
-            if app.db.users.find_one({"email": email}):
-                flash("Bu e-posta ile zaten bir hesabınız var. Lütfen giriş yapın.", "warning")
-                return redirect(url_for("login"))
-
-            cleaned_phone = "".join(ch for ch in phone if ch.isdigit() or ch == "+")
+            cleaned_phone = _NON_PHONE_RE.sub("", phone)
             if len(cleaned_phone) < 10:
                 flash("Lütfen geçerli bir telefon numarası girin.", "error")
                 return render_form()
 
-            if app.db.users.find_one({"phone": cleaned_phone}):
-                flash("Bu telefon numarasıyla kayıtlı bir hesap mevcut. Lütfen giriş yapın.", "warning")
-                return redirect(url_for("login"))
-
-            tckn = "".join(ch for ch in identity_number if ch.isdigit())
+            tckn = _NON_DIGIT_RE.sub("", identity_number)
             if not validate_tckn(tckn):
                 flash("T.C. Kimlik numarası doğrulanamadı. Lütfen bilgiyi kontrol edin.", "error")
                 return render_form()
 
             tckn_hash = hash_identity_number(tckn)
-            if app.db.users.find_one({"identity_number_hash": tckn_hash}):
-                flash("Bu T.C. Kimlik numarasıyla kayıtlı bir hesap mevcut.", "warning")
+
+            # E-posta, telefon ve TCKN tekilliğini tek sorguda kontrol et
+            conflict = app.db.users.find_one(
+                {
+                    "$or": [
+                        {"email": email},
+                        {"phone": cleaned_phone},
+                        {"identity_number_hash": tckn_hash},
+                    ]
+                },
+                {"email": 1, "phone": 1, "identity_number_hash": 1},
+            )
+            if conflict:
+                if conflict.get("email") == email:
+                    flash("Bu e-posta ile zaten bir hesabınız var. Lütfen giriş yapın.", "warning")
+                elif conflict.get("phone") == cleaned_phone:
+                    flash("Bu telefon numarasıyla kayıtlı bir hesap mevcut. Lütfen giriş yapın.", "warning")
+                else:
+                    flash("Bu T.C. Kimlik numarasıyla kayıtlı bir hesap mevcut.", "warning")
                 return redirect(url_for("login"))
 
-            sponsor_doc = None
             placement_parent_id = None
             placement_position = None
             placement_status = "placed" if not requires_referral else "pending"
@@ -1389,21 +1639,15 @@ def register_routes(app: Flask) -> None:
                     flash("ID kodu zorunludur.", "error")
                     return render_form()
 
-                sponsor_doc = app.db.users.find_one({"referral_code": sponsor_code})
                 if not sponsor_doc:
                     flash("Geçerli bir ID kodu giriniz.", "error")
                     return render_form()
 
-                sponsor_info = {
-                    "name": sponsor_doc.get("name", ""),
-                    "referral_code": sponsor_doc.get("referral_code"),
-                }
-
                 placement_parent_id = sponsor_doc.get("_id")
                 placement_status = "pending"
 
             password_hash = generate_password_hash(password)
-            referral_code = generate_referral_code(app)
+            referral_code = generate_referral_code()
             encrypted_tckn = encrypt_identity_number(tckn)
             full_name = f"{first_name} {last_name}".strip()
 
@@ -1442,8 +1686,23 @@ def register_routes(app: Flask) -> None:
                 },
             }
 
-            result = app.db.users.insert_one(user_doc)
-
+            for attempt in range(1, REFERRAL_CODE_ATTEMPTS + 1):
+                try:
+                    result = app.db.users.insert_one(user_doc)
+                    break
+                except DuplicateKeyError as exc:
+                    key_pattern = (exc.details or {}).get("keyPattern") or {}
+                    if "referral_code" not in key_pattern:
+                        # Tekillik kontrolü ile kayıt arasında aynı bilgilerle başka bir kayıt oluştu
+                        flash("Bu bilgilerle kayıtlı bir hesap mevcut. Lütfen giriş yapın.", "warning")
+                        return redirect(url_for("login"))
+                    if attempt == REFERRAL_CODE_ATTEMPTS:
+                        flash("ID kodu oluşturulamadı. Lütfen tekrar deneyin.", "error")
+                        return render_form()
+                    referral_code = generate_referral_code()
+                    user_doc["referral_code"] = referral_code
+
+            app.has_any_user = True
             session["user_id"] = str(result.inserted_id)
             if placement_status == "pending":
                 flash(
@@ -1454,24 +1713,38 @@ def register_routes(app: Flask) -> None:
                 flash(f"Kayıt işlemi tamamlandı. ID'niz: {referral_code}", "success")
             return redirect(url_for("index"))
 
-        sponsor_code = request.args.get("sponsor", "").strip().upper()
+        sponsor_code = request.args.get("sponsor", "").strip().upper()[:SPONSOR_CODE_MAX_LENGTH]
         selected_country = COUNTRY_OPTIONS[0]["dial_code"] if COUNTRY_OPTIONS else None
 
+        # Anonim, sepeti ve bekleyen flash mesajı olmayan ziyaretçiler aynı sayfayı görür.
+        # Not: forma oturuma bağlı içerik (ör. CSRF token) eklenirse bu önbellek kaldırılmalı.
         if sponsor_code:
-            sponsor_doc = app.db.users.find_one({"referral_code": sponsor_code})
+            sponsor_doc = app.db.users.find_one({"referral_code": sponsor_code}, SPONSOR_PROJECTION)
             if sponsor_doc:
                 sponsor_info = {
                     "name": sponsor_doc.get("name", ""),
                     "referral_code": sponsor_doc.get("referral_code"),
                 }
 
-        province_list_default = list(PROVINCES.keys())
+        # Yalnızca sponsorsuz ya da var olan bir sponsora ait sayfalar önbelleğe alınır;
+        # rastgele ?sponsor= değerleri önbelleği dolduramaz.
+        page_cacheable = (
+            g.user is None
+            and not session.get("cart")
+            and "_flashes" not in session
+            and (not sponsor_code or sponsor_info is not None)
+        )
+        page_cache_key = f"register_page_etag:{g.locale}:{int(requires_referral)}:{sponsor_code}"
+        if page_cacheable:
+            cached_page = app.cache.get(page_cache_key)
+            if cached_page is not None:
+                return cached_page_response(*cached_page)
 
-        return render_template(
+        page = render_template(
             "auth/register.html",
             countries=COUNTRY_OPTIONS,
-            province_list=province_list_default,
-            province_map=PROVINCES,
+            province_list=PROVINCE_LIST,
+            province_map_json=PROVINCES_JSON,
             selected_country=selected_country,
             requires_referral=requires_referral,
             sponsor_code=sponsor_code,
@@ -1498,6 +1771,11 @@ def register_routes(app: Flask) -> None:
             agreement_distributor=False,
             agreement_kvkk=False,
         )
+        if page_cacheable:
+            etag = hashlib.sha1(page.encode("utf-8")).hexdigest()
+            app.cache.set(page_cache_key, (page, etag), timeout=60)
+            return cached_page_response(page, etag)
+        return page
 
     @app.route("/dashboard")
     @login_required
@@ -1509,51 +1787,71 @@ def register_routes(app: Flask) -> None:
             base_url = request.url_root.rstrip("/")
             referral_link = f"{base_url}{url_for('register')}?sponsor={referral_code}"
 
-        pending_cursor = app.db.users.find(
-            {
-                "placement_status": "pending",
-                "placement_parent_id": user["_id"],
-            },
-            {
-                "profile.first_name": 1,
-                "profile.last_name": 1,
-                "email": 1,
-                "created_at": 1,
-                "referral_code": 1,
-            },
+        # Sol/sağ ekip sayıları ve yerleşim bekleyenler tek aggregation ile
+        team_summary = next(
+            app.db.users.aggregate(
+                [
+                    {"$match": {"placement_parent_id": user["_id"]}},
+                    {
+                        "$facet": {
+                            "left": [
+                                {"$match": {"placement_status": "placed", "placement_position": "left"}},
+                                {"$count": "n"},
+                            ],
+                            "right": [
+                                {"$match": {"placement_status": "placed", "placement_position": "right"}},
+                                {"$count": "n"},
+                            ],
+                            "pending": [
+                                {"$match": {"placement_status": "pending"}},
+                                {
+                                    "$project": {
+                                        "_id": 0,
+                                        "id": {"$toString": "$_id"},
+                                        "name": {
+                                            "$let": {
+                                                "vars": {
+                                                    "full_name": {
+                                                        "$trim": {
+                                                            "input": {
+                                                                "$concat": [
+                                                                    {"$ifNull": ["$profile.first_name", ""]},
+                                                                    " ",
+                                                                    {"$ifNull": ["$profile.last_name", ""]},
+                                                                ]
+                                                            }
+                                                        }
+                                                    }
+                                                },
+                                                "in": {
+                                                    "$cond": [
+                                                        {"$eq": ["$$full_name", ""]},
+                                                        {"$ifNull": ["$email", "Üye"]},
+                                                        "$$full_name",
+                                                    ]
+                                                },
+                                            }
+                                        },
+                                        "email": 1,
+                                        "joined_at": "$created_at",
+                                        "referral_code": 1,
+                                    }
+                                },
+                            ],
+                        }
+                    },
+                ]
+            ),
+            {},
         )
-        pending_placements: List[Dict] = []
-        for doc in pending_cursor:
-            pending_placements.append(
-                {
-                    "id": str(doc["_id"]),
-                    "name": (
-                        f"{doc.get('profile', {}).get('first_name', '')} "
-                        f"{doc.get('profile', {}).get('last_name', '')}"
-                    ).strip()
-                    or doc.get("email", "Üye"),
-                    "email": doc.get("email"),
-                    "joined_at": doc.get("created_at"),
-                    "referral_code": doc.get("referral_code"),
-                }
-            )
+        team_left = team_summary["left"][0]["n"] if team_summary.get("left") else 0
+        team_right = team_summary["right"][0]["n"] if team_summary.get("right") else 0
+
+        # Bekleyen üyeler sunucuda şablonun beklediği biçimde hazırlanır
+        pending_placements: List[Dict] = team_summary.get("pending", [])
 
         profile = user.get("profile", {})
         sponsor_count = app.db.users.count_documents({"sponsor_id": user["_id"]})
-        team_left = app.db.users.count_documents(
-            {
-                "placement_parent_id": user["_id"],
-                "placement_position": "left",
-                "placement_status": "placed",
-            }
-        )
-        team_right = app.db.users.count_documents(
-            {
-                "placement_parent_id": user["_id"],
-                "placement_position": "right",
-                "placement_status": "placed",
-            }
-        )
         matching_left = profile.get("matching_left", 0)
         matching_right = profile.get("matching_right", 0)
         personal_cv = profile.get("personal_cv", 0)
@@ -1563,8 +1861,7 @@ def register_routes(app: Flask) -> None:
         title_value = profile.get("title") or profile.get("membership_type", "Girişimci").title()
 
         stored_avatar = profile.get("avatar_url") or user.get("avatar_url")
-        user_initials = generate_initials(user.get("name", ""))
-        avatar_src = stored_avatar or build_initials_avatar(user_initials)
+        avatar_src = stored_avatar or initials_avatar_for(user.get("name", ""))
 
         varis_members = collect_varis_members(user)
         dashboard_cards = [
@@ -1698,9 +1995,10 @@ def register_routes(app: Flask) -> None:
         current_career = turkish_to_english.get(current_turkish, "Distributor")
         careers = [entry["english"] for entry in career_entries]
 
+        now = datetime.utcnow()
         time_control = {
-            "selected_month": request.args.get("month", datetime.utcnow().strftime("%B")),
-            "selected_year": request.args.get("year", str(datetime.utcnow().year)),
+            "selected_month": request.args.get("month", now.strftime("%B")),
+            "selected_year": request.args.get("year", str(now.year)),
         }
 
         rank_cards = []
@@ -1813,10 +2111,7 @@ def register_routes(app: Flask) -> None:
         gender_raw = profile.get("gender", "")
         gender_display = gender_map.get(gender_raw.lower(), gender_raw.upper() if gender_raw else "Belirtilmedi")
 
-        country_name = next(
-            (c["name"] for c in COUNTRY_OPTIONS if c["dial_code"] == user.get("country_code")),
-            None,
-        )
+        country_name = COUNTRY_BY_DIAL.get(user.get("country_code"), {}).get("name")
         country_label = country_name or profile.get("country") or "Belirtilmedi"
 
         birth_date_label = None
@@ -2189,14 +2484,20 @@ def register_routes(app: Flask) -> None:
             flash("Sadece JPG, PNG, GIF veya WEBP formatları desteklenmektedir.", "error")
             return redirect(url_for("dashboard"))
 
-        extension = file.filename.rsplit(".", 1)[1].lower()
-        timestamp = int(datetime.utcnow().timestamp())
-        filename = secure_filename(f"{user['_id']}_{timestamp}.{extension}")
-        avatars_dir = os.path.join(app.root_path, "static", "avatars")
-        os.makedirs(avatars_dir, exist_ok=True)
-        filepath = os.path.join(avatars_dir, filename)
+        file.stream.seek(0, os.SEEK_END)
+        file_size = file.stream.tell()
+        file.stream.seek(0)
+        if file_size > app.config["AVATAR_MAX_SIZE"]:
+            flash("Profil resmi en fazla 2 MB olabilir.", "error")
+            return redirect(url_for("dashboard"))
+
         try:
-            file.save(filepath)
+            filename = save_avatar_image(
+                file, app.config["AVATARS_DIR"], f"{user['_id']}_{uuid4().hex}", file_size
+            )
+        except (OSError, ValueError, Image.DecompressionBombError):
+            flash("Geçerli bir resim dosyası yükleyin.", "error")
+            return redirect(url_for("dashboard"))
         except Exception:
             flash("Profil resmi yüklenirken bir hata oluştu.", "error")
             return redirect(url_for("dashboard"))
@@ -2263,19 +2564,15 @@ def register_routes(app: Flask) -> None:
         }
 
         if entry_id:
-            existing = app.db.users.find_one(
+            # Alan bazında güncelle; created_at korunur, updated_at sunucu saatiyle damgalanır
+            result = app.db.users.update_one(
                 {"_id": user["_id"], "profile.varis_entries.entry_id": entry_id},
-                {"profile.varis_entries.$": 1},
+                {
+                    "$set": {f"profile.varis_entries.$.{key}": value for key, value in base_entry.items()},
+                    "$currentDate": {"profile.varis_entries.$.updated_at": True},
+                },
             )
-            if existing:
-                existing_entry = existing.get("profile", {}).get("varis_entries", [{}])[0]
-                base_entry["entry_id"] = entry_id
-                base_entry["created_at"] = existing_entry.get("created_at", datetime.utcnow())
-                base_entry["updated_at"] = datetime.utcnow()
-                app.db.users.update_one(
-                    {"_id": user["_id"], "profile.varis_entries.entry_id": entry_id},
-                    {"$set": {"profile.varis_entries.$": base_entry}},
-                )
+            if result.matched_count:
                 flash("Varis bilgisi güncellendi.", "success")
                 return redirect(url_for("dashboard"))
 
@@ -2326,6 +2623,12 @@ def register_routes(app: Flask) -> None:
                 user = resolve_user_by_identifier(app, identifier)
                 if user and not check_password_hash(user["password_hash"], password):
                     user = None
+                elif user and password_needs_rehash(user["password_hash"]):
+                    # Doğrulanan şifre yapılandırılmış şemayla yeniden hash'lenir (pbkdf2 <-> argon2 geçişi)
+                    app.db.users.update_one(
+                        {"_id": user["_id"], "password_hash": user["password_hash"]},
+                        {"$set": {"password_hash": generate_password_hash(password)}},
+                    )
 
             if not user:
                 logger.warning(f"Failed login attempt for identifier: {identifier} from IP: {request.remote_addr}")
@@ -2389,41 +2692,28 @@ def register_routes(app: Flask) -> None:
         if quantity < 1:
             quantity = 1
 
-        cart: List[Dict] = session.get("cart", [])
-        for item in cart:
-            if item["product_id"] == str(product["_id"]):
-                item["quantity"] += quantity
-                break
-        else:
-            cart.append({"product_id": str(product["_id"]), "quantity": quantity})
-
-        session["cart"] = cart
-        session.modified = True
+        cart = get_session_cart()
+        cart_key = str(product["_id"])
+        cart[cart_key] = cart.get(cart_key, 0) + quantity
+        store_cart(cart)
 
         flash(f"{product['name']} sepetinize eklendi.", "success")
         return redirect(request.referrer or url_for("index"))
 
     @app.route("/cart/update/<product_id>", methods=["POST"])
     def update_cart_item(product_id: str):
-        cart: List[Dict] = session.get("cart", [])
+        cart = get_session_cart()
         try:
             quantity = int(request.form.get("quantity", "1"))
         except ValueError:
             quantity = 1
 
-        updated = False
-        for item in cart:
-            if item["product_id"] == product_id:
-                if quantity <= 0:
-                    cart.remove(item)
-                else:
-                    item["quantity"] = quantity
-                updated = True
-                break
-
-        if updated:
-            session["cart"] = cart
-            session.modified = True
+        if product_id in cart:
+            if quantity <= 0:
+                del cart[product_id]
+            else:
+                cart[product_id] = quantity
+            store_cart(cart)
             flash("Sepetiniz güncellendi.", "info")
 
         return redirect(url_for("cart"))
@@ -2431,6 +2721,7 @@ def register_routes(app: Flask) -> None:
     @app.route("/cart/clear", methods=["POST"])
     def clear_cart():
         session.pop("cart", None)
+        session.pop("cart_count", None)
         flash("Sepetiniz temizlendi.", "info")
         return redirect(url_for("cart"))
 
@@ -2535,7 +2826,7 @@ def register_routes(app: Flask) -> None:
                 "order_number": order_number,
                 "items": [
                     {
-                        "product_id": ObjectId(item["product_id"]),
+                        "product_id": item["product_oid"],
                         "name": item["product"]["name"],
                         "price": item["product"]["price"],
                         "quantity": item["quantity"],
@@ -2557,6 +2848,7 @@ def register_routes(app: Flask) -> None:
 
             app.db.orders.insert_one(order_doc)
             session.pop("cart", None)
+            session.pop("cart_count", None)
             flash("Siparişiniz alındı! Teşekkür ederiz.", "success")
             return redirect(url_for("orders"))
 
@@ -2572,10 +2864,22 @@ def register_routes(app: Flask) -> None:
     @app.route("/orders")
     @login_required
     def orders():
+        page = request.args.get("page", 1, type=int)
+        page = max(page or 1, 1)
+        # Bir fazlası okunur; sonraki sayfanın varlığı ek count sorgusu olmadan anlaşılır
         user_orders = list(
-            app.db.orders.find({"user_id": g.user["_id"]}).sort("created_at", -1)
+            app.db.orders.find({"user_id": g.user["_id"]}, ORDER_LIST_PROJECTION)
+            .sort("created_at", -1)
+            .skip((page - 1) * ORDERS_PER_PAGE)
+            .limit(ORDERS_PER_PAGE + 1)
+        )
+        has_next = len(user_orders) > ORDERS_PER_PAGE
+        return render_template(
+            "orders.html",
+            orders=user_orders[:ORDERS_PER_PAGE],
+            page=page,
+            has_next=has_next,
         )
-        return render_template("orders.html", orders=user_orders)
 
     @app.route("/placement/assign", methods=["POST"])
     @login_required
@@ -2605,23 +2909,18 @@ def register_routes(app: Flask) -> None:
             flash("Bu üyeyi yerleştirme yetkiniz yok.", "error")
             return redirect(request.referrer or url_for("index"))
 
-        parent_doc = app.db.users.find_one(
-            {"_id": g.user["_id"]}, {"left_child_id": 1, "right_child_id": 1}
-        )
-        if not parent_doc:
-            flash("Sponsor bilgisi bulunamadı.", "error")
-            return redirect(request.referrer or url_for("index"))
-
+        # Boş kolu koşullu güncelleme ile sahiplen: okuma + yazma arasındaki yarışı kapatır
         child_field = f"{placement_side}_child_id"
-        if parent_doc.get(child_field):
+        claim = app.db.users.update_one(
+            {"_id": g.user["_id"], child_field: None},
+            {"$set": {child_field: pending_user["_id"]}},
+        )
+        if not claim.matched_count:
             flash(f"{placement_side.capitalize()} kolu zaten dolu.", "error")
             return redirect(request.referrer or url_for("index"))
 
-        app.db.users.update_one(
-            {"_id": g.user["_id"]}, {"$set": {child_field: pending_user["_id"]}}
-        )
-        app.db.users.update_one(
-            {"_id": pending_user["_id"]},
+        placed = app.db.users.update_one(
+            {"_id": pending_user["_id"], "placement_status": "pending"},
             {
                 "$set": {
                     "placement_status": "placed",
@@ -2629,6 +2928,14 @@ def register_routes(app: Flask) -> None:
                 }
             },
         )
+        if not placed.matched_count:
+            # Üye bu arada yerleştirildi; sahiplenilen kolu geri bırak
+            app.db.users.update_one(
+                {"_id": g.user["_id"], child_field: pending_user["_id"]},
+                {"$set": {child_field: None}},
+            )
+            flash("Bu üye zaten yerleştirilmiş.", "warning")
+            return redirect(request.referrer or url_for("index"))
 
         flash(
             f"{pending_user.get('profile', {}).get('first_name', 'Üye')} {placement_side} koluna yerleştirildi.",
@@ -2637,50 +2944,53 @@ def register_routes(app: Flask) -> None:
         return redirect(request.referrer or url_for("index"))
 
 
-def generate_referral_code(app: Flask) -> str:
-    """Her kullanıcı için benzersiz ID kodu üret."""
+def generate_referral_code() -> str:
+    """
+    Aday ID kodu üret. Tekillik `referral_code` unique index'i ile sağlanır;
+    çakışmada çağıran taraf DuplicateKeyError yakalayıp yeni kod dener.
+    """
     prefix = "TR"
-    characters = string.digits
-    for _ in range(50):
-        digits_count = random.choice([8, 9])
-        suffix = "".join(random.choices(characters, k=digits_count))
-        code = f"{prefix}{suffix}"
-        if not app.db.users.find_one({"referral_code": code}):
-            return code
-    raise RuntimeError("ID kodu oluşturulamadı. Lütfen tekrar deneyin.")
+    digits_count = secrets.choice((8, 9))
+    return f"{prefix}{secrets.randbelow(10 ** digits_count):0{digits_count}d}"
 
 
 def find_binary_slot(app: Flask, sponsor_doc: Dict) -> Tuple[Optional[ObjectId], Optional[str]]:
-    """Binary ağında uygun ilk boş pozisyonu bul."""
+    """
+    Binary ağında uygun ilk boş pozisyonu bul.
+    Ağaç seviye seviye dolaşılır; her seviyedeki düğümler tek bir $in sorgusuyla okunur.
+    """
     sponsor_id = sponsor_doc.get("_id")
     if not sponsor_id:
         return None, None
-    queue = deque([sponsor_id])
+    current_level: List[ObjectId] = [sponsor_id]
     visited: set = set()
 
-    while queue:
-        current_id = queue.popleft()
-        if current_id in visited:
-            continue
-        visited.add(current_id)
+    while current_level:
+        visited.update(current_level)
+        nodes = {
+            node["_id"]: node
+            for node in app.db.users.find(
+                {"_id": {"$in": current_level}},
+                {"left_child_id": 1, "right_child_id": 1},
+            )
+        }
 
-        node = app.db.users.find_one(
-            {"_id": current_id},
-            {"left_child_id": 1, "right_child_id": 1},
-        )
-        if not node:
-            continue
+        next_level: List[ObjectId] = []
+        for current_id in current_level:
+            node = nodes.get(current_id)
+            if not node:
+                continue
 
-        left_child = node.get("left_child_id")
-        right_child = node.get("right_child_id")
+            left_child = node.get("left_child_id")
+            right_child = node.get("right_child_id")
 
-        if not left_child:
-            return current_id, "left"
-        if not right_child:
-            return current_id, "right"
+            if not left_child:
+                return current_id, "left"
+            if not right_child:
+                return current_id, "right"
 
-        queue.append(left_child)
-        queue.append(right_child)
+            next_level.extend(child for child in (left_child, right_child) if child not in visited)
+        current_level = next_level
 
     return None, None
 
@@ -2696,18 +3006,17 @@ def resolve_user_by_identifier(app: Flask, identifier: str):
 
     lowered = identifier.lower()
     if "@" in identifier:
-        user = app.db.users.find_one({"email": lowered})
-        if user:
-            return user
+        # "@" içeren bir değer telefon ya da ID kodu olamaz; diğer aramalara gerek yok
+        return app.db.users.find_one({"email": lowered})
 
-    cleaned_phone = "".join(ch for ch in identifier if ch.isdigit() or ch == "+")
+    # Telefon ve ID kodu adayları tek $or sorgusunda; her dal kendi unique index'ini kullanır
+    clauses: List[Dict[str, str]] = [{"referral_code": identifier.upper()}]
+    cleaned_phone = _NON_PHONE_RE.sub("", identifier)
     if len(cleaned_phone) >= 10:
-        user = app.db.users.find_one({"phone": cleaned_phone})
-        if user:
-            return user
-
-    upper = identifier.upper()
-    return app.db.users.find_one({"referral_code": upper})
+        clauses.append({"phone": cleaned_phone})
+    if len(clauses) == 1:
+        return app.db.users.find_one(clauses[0])
+    return app.db.users.find_one({"$or": clauses})
 
 
 def ensure_demo_user_exists(app: Flask):
@@ -2768,18 +3077,20 @@ def ensure_demo_user_exists(app: Flask):
 
 def validate_tckn(tckn: str) -> bool:
     """T.C. Kimlik numarasını format kurallarına göre doğrula."""
-    if len(tckn) != 11 or not tckn.isdigit() or tckn[0] == "0":
+    if len(tckn) != 11 or not tckn.isascii():
+        return False
+    b = tckn.encode("ascii")
+    # bytes.isdigit yalnızca ASCII rakamları kabul eder; haneler b[i] - 0x30 ile okunur
+    if not b.isdigit() or b[0] == 0x30:
         return False
 
-    digits = [int(ch) for ch in tckn]
-    odd_sum = sum(digits[0:9:2])
-    even_sum = sum(digits[1:8:2])
-    digit10 = ((odd_sum * 7) - even_sum) % 10
-    if digit10 != digits[9]:
+    odd_sum = b[0] + b[2] + b[4] + b[6] + b[8] - 5 * 0x30
+    even_sum = b[1] + b[3] + b[5] + b[7] - 4 * 0x30
+    digit10 = b[9] - 0x30
+    if ((odd_sum * 7) - even_sum) % 10 != digit10:
         return False
 
-    digit11 = (sum(digits[:10])) % 10
-    return digit11 == digits[10]
+    return (odd_sum + even_sum + digit10) % 10 == b[10] - 0x30
 
 
 def hash_identity_number(tckn: str) -> str:
@@ -2787,39 +3098,59 @@ def hash_identity_number(tckn: str) -> str:
     return hashlib.sha256(tckn.encode("utf-8")).hexdigest()
 
 
+class IdentityCipher:
+    """
+    cryptography.Fernet ve rfernet için ortak, str tabanlı arayüz.
+    rfernet str döndürür / yalnızca str kabul eder; cryptography bytes ile çalışır.
+    Çözülemeyen token her iki arka uçta da None olarak döner.
+    """
+
+    def __init__(self, key: bytes, use_rust: bool = RustFernet is not None):
+        self.use_rust = use_rust
+        self._fernet = RustFernet(key.decode("ascii")) if use_rust else Fernet(key)
+
+    def encrypt(self, value: str) -> str:
+        data = value.encode("utf-8")
+        token = self._fernet.encrypt(data)
+        return token if isinstance(token, str) else token.decode("ascii")
+
+    def decrypt(self, token: str) -> Optional[str]:
+        try:
+            if self.use_rust:
+                value = self._fernet.decrypt(token)
+            else:
+                value = self._fernet.decrypt(token.encode("ascii"))
+            return value.decode("utf-8") if isinstance(value, bytes) else value
+        except (InvalidToken, RustInvalidToken, TypeError, ValueError):
+            # rfernet bozuk token'da TypeError da fırlatabilir; ascii/utf-8 hataları ValueError'dır
+            return None
+
+
 def encrypt_identity_number(tckn: str) -> str:
     """TCKN değerini Fernet ile şifrele."""
-    cipher = get_identity_cipher()
-    token = cipher.encrypt(tckn.encode("utf-8"))
-    return token.decode("utf-8")
+    return get_identity_cipher().encrypt(tckn)
 
 
 def decrypt_identity_number(token: str) -> Optional[str]:
     """Gerekirse TCKN bilgisini çöz."""
-    cipher = get_identity_cipher()
-    try:
-        value = cipher.decrypt(token.encode("utf-8"))
-        return value.decode("utf-8")
-    except (InvalidToken, ValueError):
-        return None
-
+    return get_identity_cipher().decrypt(token)
 
-def get_identity_cipher() -> Fernet:
-    """TCKN şifreleme için Fernet cipher'ını oluştur."""
-    global _identity_cipher
-    if _identity_cipher is not None:
-        return _identity_cipher
 
+@lru_cache(maxsize=1)
+def get_identity_cipher() -> IdentityCipher:
+    """
+    TCKN şifreleme için cipher'ı oluştur (rfernet kuruluysa o, değilse cryptography).
+    Anahtar türetimi bir kez yapılır; create_app açılışta çağırarak hatalı anahtarı erkenden yakalar.
+    """
     try:
         config = get_config()
         secret = config.TCKN_SECRET_KEY
         
         digest = hashlib.sha256(secret.encode("utf-8")).digest()
-        key = base64.urlsafe_b64encode(digest)
-        _identity_cipher = Fernet(key)
+        cipher = IdentityCipher(base64.urlsafe_b64encode(digest))
         
         logger.info("TCKN cipher initialized successfully")
-        return _identity_cipher
+        return cipher
         
     except Exception as e:
         logger.error(f"Failed to initialize TCKN cipher: {str(e)}")
@@ -2829,10 +3160,69 @@ def get_identity_cipher() -> Fernet:
         )
 
 
+def get_session_cart() -> Dict[str, int]:
+    """
+    Oturumdaki sepeti {product_id: adet} sözlüğü olarak döndür.
+    Eski liste biçimindeki sepetler ilk erişimde dönüştürülür.
+    """
+    cart = session.get("cart")
+    if not cart:
+        return {}
+    if isinstance(cart, list):
+        migrated: Dict[str, int] = {}
+        for item in cart:
+            product_id = item.get("product_id")
+            if product_id:
+                migrated[product_id] = migrated.get(product_id, 0) + int(item.get("quantity", 0))
+        store_cart(migrated)
+        return migrated
+    return cart
+
+
+def store_cart(cart: Dict[str, int]) -> None:
+    """Sepeti ve toplam ürün adedini oturuma birlikte yaz."""
+    session["cart"] = cart
+    session["cart_count"] = sum(cart.values())
+    session.modified = True
+
+
+def get_cached_products(app: Flask, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Sepet alanlarıyla (CART_PRODUCT_PROJECTION) ürünleri {product_id: ürün} olarak getir.
+    Önce kısa süreli önbelleğe bakılır; eksikler tek bir $in sorgusuyla tamamlanıp önbelleğe yazılır.
+    """
+    if not product_ids:
+        return {}
+
+    cached_docs = app.cache.get_many(*(f"product:{product_id}" for product_id in product_ids))
+    products: Dict[str, Dict[str, Any]] = {}
+    missing: List[ObjectId] = []
+    for product_id, doc in zip(product_ids, cached_docs):
+        if doc is not None:
+            products[product_id] = doc
+        elif ObjectId.is_valid(product_id):
+            missing.append(ObjectId(product_id))
+        else:
+            logger.warning(f"Invalid product_id in cart: {product_id}")
+
+    if missing:
+        fetched = {
+            str(doc["_id"]): doc
+            for doc in app.db.products.find({"_id": {"$in": missing}}, CART_PRODUCT_PROJECTION)
+        }
+        if fetched:
+            app.cache.set_many(
+                {f"product:{product_id}": doc for product_id, doc in fetched.items()},
+                timeout=PRODUCT_CACHE_TIMEOUT,
+            )
+        products.update(fetched)
+    return products
+
+
 def fetch_product(app: Flask, product_id: str):
-    """Verilen ürün kimliğiyle ürünü bul."""
+    """Verilen ürün kimliğiyle ürünü (sepet alanlarıyla, önbellekten) bul."""
     try:
-        return app.db.products.find_one({"_id": ObjectId(product_id)})
+        return get_cached_products(app, [product_id]).get(product_id)
     except Exception:
         return None
 
@@ -2841,9 +3231,9 @@ def load_cart_with_products(app: Flask):
     """
     Oturumdaki sepet öğelerini ürün detaylarıyla birleştir.
     N+1 query sorununu çözülmüş optimized versiyon.
-    cart_items çıktısı: [{"product": product_doc, "quantity": int, "line_total": float}, ...]
+    cart_items çıktısı: [{"product": product_doc, "product_id": str, "product_oid": ObjectId, "quantity": int, "line_total": float}, ...]
     """
-    cart: List[Dict] = session.get("cart", [])
+    cart = get_session_cart()
     if not cart:
         return [], 0.0
     
@@ -2851,41 +3241,32 @@ def load_cart_with_products(app: Flask):
     cart_total = 0.0
 
     try:
-        # Collect all product IDs
-        product_ids = []
-        for item in cart:
-            try:
-                product_ids.append(ObjectId(item["product_id"]))
-            except Exception:
-                logger.warning(f"Invalid product_id in cart: {item.get('product_id')}")
-                continue
-        
-        if not product_ids:
-            return [], 0.0
-        
-        # Fetch all products in one query (solves N+1 problem)
-        products = list(app.db.products.find({"_id": {"$in": product_ids}}))
-        product_map = {str(p["_id"]): p for p in products}
+        # Önbellekte olmayan ürünler tek sorguda gelir (N+1 yok)
+        product_map = get_cached_products(app, list(cart))
         
         # Build cart items
-        for item in cart:
-            product_id = item["product_id"]
+        for product_id, quantity in cart.items():
             product = product_map.get(product_id)
             
             if not product:
                 logger.warning(f"Product not found: {product_id}")
                 continue
 
-            quantity = int(item.get("quantity", 1))
-            line_total = float(product.get("price", 0)) * quantity
+            # Fiyat okuma sınırında bir kez float'a çevrilir; şablon ve sipariş kaydı bu değeri kullanır
+            price = float(product.get("price", 0))
+            line_total = price * quantity
             cart_total += line_total
 
-            product_data = dict(product)
-            product_data["_id"] = str(product["_id"])
+            # Sorgu ve önbellek her çağrıda yeni dict döndürür; kopyalamadan yerinde güncellemek güvenli.
+            # Şablonlar için _id metne çevrilir; ObjectId sipariş kaydında yeniden ayrıştırılmasın diye saklanır.
+            product_oid = product["_id"]
+            product["_id"] = product_id
+            product["price"] = price
 
             detailed_items.append({
-                "product": product_data,
-                "product_id": product_data["_id"],
+                "product": product,
+                "product_id": product_id,
+                "product_oid": product_oid,
                 "quantity": quantity,
                 "line_total": line_total,
             })
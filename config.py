@@ -62,6 +62,11 @@ class Config:
     MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/bestwork')
     MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
     MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 10))
+    # Havuz doluyken bağlantı için en fazla bu kadar beklenir; istek sınırsız takılmak yerine hata alır
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+    # Sunucuyla ilk ortak algoritma seçilir. zlib standart kütüphanededir; zstd / snappy
+    # için zstandard / python-snappy kurulup bu değer genişletilmelidir.
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zlib')
     
     # Security
     TCKN_SECRET_KEY = os.environ.get('TCKN_SECRET_KEY')
@@ -75,12 +80,21 @@ class Config:
                 f"TCKN_SECRET_KEY oluşturulamadı: {e}. "
                 "Lütfen .env dosyasını kontrol edin."
             )
+    # "pbkdf2" (varsayılan) veya "argon2" (argon2-cffi gerekir). Hash'ler girişte seçili şemaya
+    # taşınır. Uyarı: argon2 ile oluşan hash'leri argon2 desteği olmayan eski sürümler doğrulayamaz;
+    # geri dönmeden önce bu değeri "pbkdf2" yapıp kullanıcıların girişte geri taşınmasını bekleyin.
+    PASSWORD_HASH_SCHEME = os.environ.get('PASSWORD_HASH_SCHEME', 'pbkdf2')
+    
     # Session Configuration
     SESSION_COOKIE_SECURE = True  # HTTPS only
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     SESSION_COOKIE_NAME = 'bestwork_session'
+    # Sunucu taraflı oturum (Opsiyonel): "redis" ile oturum/sepet verisi Redis'te tutulur,
+    # çerezde yalnızca oturum kimliği taşınır (Flask-Session gerekir). Boş bırakılırsa imzalı çerez kullanılır.
+    SESSION_TYPE = os.environ.get('SESSION_TYPE') or None
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
     
     # CSRF Protection
     WTF_CSRF_ENABLED = True
@@ -97,13 +111,21 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = 300
     CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Templates
+    # Boşsa Jinja kullanıcıya özel, 0700 izinli ve sahiplik kontrollü geçici dizini kullanır
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR') or None
+    
     # File Upload
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     UPLOAD_FOLDER = 'static/uploads'
+    AVATAR_MAX_SIZE = int(os.environ.get('AVATAR_MAX_SIZE', 2 * 1024 * 1024))  # 2MB
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
-    LOG_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'class DevelopmentConfig(Config):
+    LOG_FORMAT = '[%(asctime)s] %(levelname)s in %(module)s: %(message)s'
+
+
+class DevelopmentConfig(Config):
     """Development environment configuration"""
     DEBUG = True
     TESTING = False
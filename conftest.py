@@ -0,0 +1 @@
+# Depo kökü sys.path'e eklensin diye boş bırakılır; testler `import app` kullanır.
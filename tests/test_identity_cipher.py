@@ -0,0 +1,50 @@
+"""IdentityCipher: cryptography ve rfernet arka uçları için TCKN şifreleme testleri."""
+import base64
+import hashlib
+
+import pytest
+
+pytest.importorskip("cryptography")
+app_module = pytest.importorskip("app")
+
+KEY = base64.urlsafe_b64encode(hashlib.sha256(b"test-secret").digest())
+TCKN = "10000000146"
+
+
+def _backends():
+    backends = [pytest.param(False, id="cryptography")]
+    backends.append(
+        pytest.param(
+            True,
+            id="rfernet",
+            marks=pytest.mark.skipif(app_module.RustFernet is None, reason="rfernet kurulu değil"),
+        )
+    )
+    return backends
+
+
+@pytest.mark.parametrize("use_rust", _backends())
+def test_round_trip(use_rust):
+    cipher = app_module.IdentityCipher(KEY, use_rust=use_rust)
+    token = cipher.encrypt(TCKN)
+    assert isinstance(token, str)
+    assert cipher.decrypt(token) == TCKN
+
+
+@pytest.mark.parametrize("use_rust", _backends())
+def test_bad_token_returns_none(use_rust):
+    cipher = app_module.IdentityCipher(KEY, use_rust=use_rust)
+    token = cipher.encrypt(TCKN)
+    tampered = token[:-4] + ("AAAA" if not token.endswith("AAAA") else "BBBB")
+    assert cipher.decrypt(tampered) is None
+    assert cipher.decrypt("not-a-token") is None
+    assert cipher.decrypt("ş") is None
+
+
+def test_backends_share_token_format():
+    if app_module.RustFernet is None:
+        pytest.skip("rfernet kurulu değil")
+    rust = app_module.IdentityCipher(KEY, use_rust=True)
+    python = app_module.IdentityCipher(KEY, use_rust=False)
+    assert python.decrypt(rust.encrypt(TCKN)) == TCKN
+    assert rust.decrypt(python.encrypt(TCKN)) == TCKN